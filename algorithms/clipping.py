@@ -0,0 +1,54 @@
+import math
+
+
+def liang_barsky(x1, y1, x2, y2, xmin, ymin, xmax, ymax):
+    dx = x2 - x1
+    dy = y2 - y1
+
+    t0, t1 = 0.0, 1.0
+
+    for p, q in (
+        (-dx, x1 - xmin),
+        (dx, xmax - x1),
+        (-dy, y1 - ymin),
+        (dy, ymax - y1),
+    ):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+
+    return t0, t1
+
+
+def clip_steps(x1, y1, x2, y2, steps, rect, margin=2):
+    # Range of step indices of a `steps`-step walk from (x1, y1) to (x2, y2)
+    # whose cells can fall inside `rect`. Rasterized cells stray from the
+    # ideal line by less than `margin`, so the window is grown by that much.
+    xmin, ymin, xmax, ymax = rect
+    t = liang_barsky(
+        x1, y1, x2, y2, xmin - margin, ymin - margin, xmax + margin, ymax + margin
+    )
+    if t is None:
+        return None
+
+    t0, t1 = t
+    first = max(0, math.floor(t0 * steps))
+    last = min(int(steps), math.ceil(t1 * steps))
+    if first > last:
+        return None
+    return first, last
+
+
+def in_rect(x, y, rect):
+    return rect[0] <= x <= rect[2] and rect[1] <= y <= rect[3]
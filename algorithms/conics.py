@@ -1,24 +1,18 @@
-def bresenham_circle(cx, cy, r):
-    r = max(1, round(r))
+import threading
+from collections import OrderedDict
+from itertools import repeat
+
+import numpy as np
+
+from algorithms.spans import SPAN_DTYPE
+
+
+def _circle_octant(r):
     x, y = 0, r
     d = 1 - r
-    seen = set()
 
     while x <= y:
-        points = [
-            (cx + x, cy + y),
-            (cx - x, cy + y),
-            (cx + x, cy - y),
-            (cx - x, cy - y),
-            (cx + y, cy + x),
-            (cx - y, cy + x),
-            (cx + y, cy - x),
-            (cx - y, cy - x),
-        ]
-        for px, py in points:
-            if (px, py) not in seen:
-                seen.add((px, py))
-                yield (px, py, 1.0)
+        yield x, y
 
         if d < 0:
             d += 2 * x + 3
@@ -28,28 +22,15 @@ def bresenham_circle(cx, cy, r):
         x += 1
 
 
-def midpoint_ellipse(cx, cy, a, b):
-    a = max(1, round(a))
-    b = max(1, round(b))
-
+def _ellipse_quadrant(a, b):
     a2 = a * a
     b2 = b * b
-    seen = set()
 
     x, y = 0, b
     d1 = b2 - a2 * b + a2 / 4.0
 
     while 2 * b2 * x <= 2 * a2 * y:
-        points = [
-            (cx + x, cy + y),
-            (cx - x, cy + y),
-            (cx + x, cy - y),
-            (cx - x, cy - y),
-        ]
-        for px, py in points:
-            if (px, py) not in seen:
-                seen.add((px, py))
-                yield (px, py, 1.0)
+        yield x, y
 
         if d1 < 0:
             d1 += 2 * b2 * x + b2
@@ -61,16 +42,7 @@ def midpoint_ellipse(cx, cy, a, b):
     d2 = b2 * (x + 0.5) ** 2 + a2 * (y - 1) ** 2 - a2 * b2
 
     while y >= 0:
-        points = [
-            (cx + x, cy + y),
-            (cx - x, cy + y),
-            (cx + x, cy - y),
-            (cx - x, cy - y),
-        ]
-        for px, py in points:
-            if (px, py) not in seen:
-                seen.add((px, py))
-                yield (px, py, 1.0)
+        yield x, y
 
         if d2 > 0:
             d2 += -2 * a2 * y + a2
@@ -80,30 +52,103 @@ def midpoint_ellipse(cx, cy, a, b):
         y -= 1
 
 
-def midpoint_hyperbola(cx, cy, a, b, limit=None):
+def _quadrant_spans(cx, cy, y, x_start, x_end):
+    # Row `y` of the first quadrant covers columns x_start..x_end; mirror it
+    # into all four quadrants, joining the halves when it touches the axis.
+    for row in (cy + y, cy - y) if y else (cy,):
+        if x_start == 0:
+            yield (row, cx - x_end, cx + x_end, 1.0)
+        else:
+            yield (row, cx + x_start, cx + x_end, 1.0)
+            yield (row, cx - x_end, cx - x_start, 1.0)
+
+
+def _quadrant_points(cx, cy, x, y):
+    yield (cx + x, cy + y, 1.0)
+    if x:
+        yield (cx - x, cy + y, 1.0)
+    if y:
+        yield (cx + x, cy - y, 1.0)
+    if x and y:
+        yield (cx - x, cy - y, 1.0)
+
+
+def bresenham_circle(cx, cy, r):
+    r = max(1, round(r))
+
+    # Reflections only coincide on the axes (x == 0) and on the diagonal
+    # (x == y, where the swapped octants repeat the first four points).
+    for x, y in _circle_octant(r):
+        yield (cx + x, cy + y, 1.0)
+        if x:
+            yield (cx - x, cy + y, 1.0)
+        yield (cx + x, cy - y, 1.0)
+        if x:
+            yield (cx - x, cy - y, 1.0)
+
+        if x == y:
+            continue
+        yield (cx + y, cy + x, 1.0)
+        yield (cx - y, cy + x, 1.0)
+        if x:
+            yield (cx + y, cy - x, 1.0)
+            yield (cx - y, cy - x, 1.0)
+
+
+def bresenham_circle_spans(cx, cy, r):
+    r = max(1, round(r))
+    run = None
+
+    for x, y in _circle_octant(r):
+        # Steep octant: one cell per row. On the diagonal it is the same cell
+        # as the flat octant's, which the run below already covers.
+        if x != y:
+            yield from _quadrant_spans(cx, cy, x, y, y)
+
+        if run is not None and run[0] == y:
+            run[2] = x
+            continue
+        if run is not None:
+            yield from _quadrant_spans(cx, cy, *run)
+        run = [y, x, x]
+
+    if run is not None:
+        yield from _quadrant_spans(cx, cy, *run)
+
+
+def midpoint_ellipse(cx, cy, a, b):
     a = max(1, round(a))
     b = max(1, round(b))
 
-    if limit is None:
-        limit = max(50, 5 * b)
+    for x, y in _ellipse_quadrant(a, b):
+        yield from _quadrant_points(cx, cy, x, y)
 
+
+def midpoint_ellipse_spans(cx, cy, a, b):
+    a = max(1, round(a))
+    b = max(1, round(b))
+    run = None
+
+    for x, y in _ellipse_quadrant(a, b):
+        if run is not None and run[0] == y:
+            run[2] = x
+            continue
+        if run is not None:
+            yield from _quadrant_spans(cx, cy, *run)
+        run = [y, x, x]
+
+    if run is not None:
+        yield from _quadrant_spans(cx, cy, *run)
+
+
+def _hyperbola_quadrant(a, b):
     a2 = a * a
     b2 = b * b
-    seen = set()
 
     x, y = a, 0
 
-    while y <= limit:
-        points = [
-            (cx + x, cy + y),
-            (cx - x, cy + y),
-            (cx + x, cy - y),
-            (cx - x, cy - y),
-        ]
-        for px, py in points:
-            if (px, py) not in seen:
-                seen.add((px, py))
-                yield (px, py, 1.0)
+    while True:
+        yield x, y
 
         d = b2 * (x + 0.5) ** 2 - a2 * (y + 1) ** 2 - a2 * b2
 
@@ -113,12 +158,7 @@ def midpoint_hyperbola(cx, cy, a, b, limit=None):
         y += 1
 
 
-def midpoint_parabola(cx, cy, p, direction=1, limit=None):
-    p = max(1, round(abs(p)))
-    if limit is None:
-        limit = max(50, 5 * p)
-    seen = set()
-    dir = 1 if direction >= 0 else -1
+def _parabola_half(p):
     p2 = 2 * p
     p4 = 2 * p2
 
@@ -126,18 +166,13 @@ def midpoint_parabola(cx, cy, p, direction=1, limit=None):
     y = 0
     d = 1 - p
 
-    if (cx, cy) not in seen:
-        seen.add((cx, cy))
-        yield (cx, cy, 1.0)
+    # Every row is visited once and every column once after the bend, so
+    # the vertex is the only point that has to be skipped on the way.
+    yield x, y
 
     while y < p:
-        px = cx + dir * x
-        if (px, cy + y) not in seen:
-            seen.add((px, cy + y))
-            yield (px, cy + y, 1.0)
-        if y > 0 and (px, cy - y) not in seen:
-            seen.add((px, cy - y))
-            yield (px, cy - y, 1.0)
+        if y > 0:
+            yield x, y
 
         if d >= 0:
             x += 1
@@ -150,17 +185,230 @@ def midpoint_parabola(cx, cy, p, direction=1, limit=None):
     else:
         d = 1 - p2
 
-    while x < limit:
-        px = cx + dir * x
-        if (px, cy + y) not in seen:
-            seen.add((px, cy + y))
-            yield (px, cy + y, 1.0)
-        if y > 0 and (px, cy - y) not in seen:
-            seen.add((px, cy - y))
-            yield (px, cy - y, 1.0)
+    while True:
+        yield x, y
 
         if d < 0:
             y += 1
             d += 4 * y
         x += 1
         d -= p4
+
+
+def _parabola_points(cx, cy, dir, x, y):
+    yield (cx + dir * x, cy + y, 1.0)
+    if y > 0:
+        yield (cx + dir * x, cy - y, 1.0)
+
+
+def _reach(cx, cy, bounds, dir=0):
+    # How far (x, y) offsets from the centre can go and still have a
+    # reflection inside `bounds`; dir restricts x to one side.
+    xmin, ymin, xmax, ymax = bounds
+    if dir > 0:
+        reach_x = xmax - cx
+    elif dir < 0:
+        reach_x = cx - xmin
+    else:
+        reach_x = max(xmax - cx, cx - xmin)
+    return reach_x, max(ymax - cy, cy - ymin)
+
+
+def midpoint_hyperbola(cx, cy, a, b, limit=None, bounds=None):
+    a = max(1, round(a))
+    b = max(1, round(b))
+
+    if limit is None:
+        limit = max(50, 5 * b)
+
+    if bounds is not None:
+        reach_x, reach_y = _reach(cx, cy, bounds)
+
+    for x, y in _hyperbola_quadrant(a, b):
+        if bounds is None and y > limit:
+            break
+        if bounds is not None and (x > reach_x or y > reach_y):
+            break
+        yield from _quadrant_points(cx, cy, x, y)
+
+
+def midpoint_parabola(cx, cy, p, direction=1, limit=None, bounds=None):
+    p = max(1, round(abs(p)))
+    if limit is None:
+        limit = max(50, 5 * p)
+    dir = 1 if direction >= 0 else -1
+
+    if bounds is not None:
+        reach_x, reach_y = _reach(cx, cy, bounds, dir)
+
+    for x, y in _parabola_half(p):
+        if bounds is None and y >= p and x >= limit:
+            break
+        if bounds is not None and (x > reach_x or y > reach_y):
+            break
+        yield from _parabola_points(cx, cy, dir, x, y)
+
+
+class ConicBranches:
+    def __init__(self, offsets, points, reach):
+        self._offsets = offsets
+        self._points = points
+        self._reach = reach
+        self._pending = next(offsets)
+
+    def extend(self, bounds):
+        reach_x, reach_y = self._reach(bounds)
+        pixels = []
+
+        x, y = self._pending
+        while x <= reach_x and y <= reach_y:
+            pixels.extend(self._points(x, y))
+            x, y = self._pending = next(self._offsets)
+
+        return pixels
+
+
+def hyperbola_branches(cx, cy, a, b):
+    a = max(1, round(a))
+    b = max(1, round(b))
+    return ConicBranches(
+        _hyperbola_quadrant(a, b),
+        lambda x, y: _quadrant_points(cx, cy, x, y),
+        lambda bounds: _reach(cx, cy, bounds),
+    )
+
+
+def parabola_branches(cx, cy, p, direction=1):
+    p = max(1, round(abs(p)))
+    dir = 1 if direction >= 0 else -1
+    return ConicBranches(
+        _parabola_half(p),
+        lambda x, y: _parabola_points(cx, cy, dir, x, y),
+        lambda bounds: _reach(cx, cy, bounds, dir),
+    )
+
+
+class ConicCache:
+    def __init__(self, max_cells=1 << 22):
+        self.max_cells = max_cells
+        self._entries = OrderedDict()
+        self._cells = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            coords = self._entries.get(key)
+            if coords is not None:
+                self._entries.move_to_end(key)
+                return coords
+
+            coords = build()
+            if len(coords) <= self.max_cells:
+                self._entries[key] = coords
+                self._cells += len(coords)
+                while self._cells > self.max_cells:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._cells -= len(evicted)
+            return coords
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._cells = 0
+
+
+_conic_cache = ConicCache()
+
+_CACHED_CONICS = {
+    ("circle", False): bresenham_circle,
+    ("circle", True): bresenham_circle_spans,
+    ("ellipse", False): midpoint_ellipse,
+    ("ellipse", True): midpoint_ellipse_spans,
+}
+
+
+def _misses_ring(cx, cy, a, b, bounds):
+    # Whether `bounds` lies wholly outside the box of an a x b ellipse, or
+    # wholly inside it clear of the outline.
+    x_min, y_min, x_max, y_max = bounds
+    if x_min > cx + a + 1 or x_max < cx - a - 1:
+        return True
+    if y_min > cy + b + 1 or y_max < cy - b - 1:
+        return True
+    if a < 2 or b < 2:
+        return False
+    corners = np.array([[x_min, x_max], [y_min, y_max]], dtype=float)
+    dx = np.abs(corners[0] - cx).max() / (a - 1)
+    dy = np.abs(corners[1] - cy).max() / (b - 1)
+    return dx * dx + dy * dy < 1
+
+
+def _placed_coords(kind, params, spans, cx, cy, bounds):
+    # The cached origin coords of a conic, less those that cannot reach into
+    # `bounds`; None if its outline misses `bounds` altogether.
+    params = tuple(max(1, round(v)) for v in params)
+    generator = _CACHED_CONICS[kind, spans]
+    if bounds is not None and _misses_ring(cx, cy, params[0], params[-1], bounds):
+        return None
+
+    def build():
+        items = [item[:-1] for item in generator(0, 0, *params)]
+        return np.array(items, dtype=np.int32).reshape(-1, 3 if spans else 2)
+
+    coords = _conic_cache.get((kind, spans, params), build)
+    if bounds is not None:
+        x_min, y_min, x_max, y_max = bounds
+        if spans:
+            y, x_start, x_end = coords.T
+            keep = (y + cy >= y_min) & (y + cy <= y_max)
+            keep &= (x_end + cx >= x_min) & (x_start + cx <= x_max)
+        else:
+            x, y = coords.T
+            keep = (x + cx >= x_min) & (x + cx <= x_max)
+            keep &= (y + cy >= y_min) & (y + cy <= y_max)
+        coords = coords[keep]
+    return coords
+
+
+def cached_conic(kind, cx, cy, *params, spans=False, bounds=None):
+    # Same output as the generator for `kind`, built once at the origin per
+    # parameter set and shifted into place on every later call. Nothing is
+    # computed until the first item is requested. With `bounds`, items that
+    # cannot reach into it are left out, and a conic whose outline misses
+    # it is not built at all.
+    coords = _placed_coords(kind, params, spans, cx, cy, bounds)
+    if coords is None:
+        return
+    opacity = repeat(1.0, len(coords))
+
+    if spans:
+        y, x_start, x_end = coords.T
+        yield from zip(
+            (y + cy).tolist(), (x_start + cx).tolist(), (x_end + cx).tolist(), opacity
+        )
+    else:
+        x, y = coords.T
+        yield from zip((x + cx).tolist(), (y + cy).tolist(), opacity)
+
+
+def cached_conic_array(kind, cx, cy, *params, spans=True, bounds=None):
+    # cached_conic shifted straight into a SPAN_DTYPE array (points as
+    # one-cell spans), so a cache hit never goes through Python tuples.
+    coords = _placed_coords(kind, params, spans, cx, cy, bounds)
+    if coords is None:
+        return np.empty(0, SPAN_DTYPE)
+
+    packed = np.empty(len(coords), SPAN_DTYPE)
+    if spans:
+        packed["y"] = coords[:, 0] + cy
+        packed["x_start"] = coords[:, 1] + cx
+        packed["x_end"] = coords[:, 2] + cx
+    else:
+        packed["y"] = coords[:, 1] + cy
+        packed["x_start"] = packed["x_end"] = coords[:, 0] + cx
+    packed["alpha"] = 255
+    return packed
+
+
+def clear_conic_cache():
+    _conic_cache.clear()
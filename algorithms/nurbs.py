@@ -0,0 +1,123 @@
+import functools
+import math
+
+import numpy as np
+
+from algorithms.parametric_curves import curve_cells
+
+
+@functools.lru_cache(maxsize=64)
+def binomial_row(n):
+    row = np.array([math.comb(n, k) for k in range(n + 1)], dtype=float)
+    row.setflags(write=False)
+    return row
+
+
+def _control(points):
+    return np.array([(p[0], p[1]) for p in points], dtype=float)
+
+
+def _parameters(steps):
+    return np.arange(steps + 1) / steps if steps > 0 else np.zeros(max(0, steps + 1))
+
+
+def bernstein_basis(n, t):
+    t = np.asarray(t, dtype=float)[:, None]
+    k = np.arange(n + 1)
+    return binomial_row(n) * t**k * (1 - t) ** (n - k)
+
+
+def bezier_n_evaluate(points, t, method="bernstein"):
+    control = _control(points)
+    t = np.asarray(t, dtype=float)
+
+    if method == "bernstein":
+        return bernstein_basis(len(control) - 1, t) @ control
+
+    # de Casteljau: repeated interpolation of the control polygon for every
+    # t at once. O(n^2) per sample but stable for very high degrees.
+    work = np.broadcast_to(control, (len(t),) + control.shape).copy()
+    s = t[:, None, None]
+    for size in range(len(control) - 1, 0, -1):
+        work[:, :size] = (1 - s) * work[:, :size] + s * work[:, 1 : size + 1]
+    return work[:, 0]
+
+
+def bezier_n_points(points, steps=20, method="bernstein"):
+    if len(points) < 2:
+        return np.empty((0, 2))
+    return bezier_n_evaluate(points, _parameters(steps), method)
+
+
+def bezier_n_curve(points, steps=20, method="bernstein", connected=False, bounds=None):
+    samples = bezier_n_points(points, steps, method)
+    yield from curve_cells(samples, connected, bounds)
+
+
+def clamped_knots(count, degree):
+    inner = np.arange(1, count - degree) / (count - degree)
+    return np.concatenate([np.zeros(degree + 1), inner, np.ones(degree + 1)])
+
+
+def _find_spans(knots, degree, count, t):
+    spans = np.searchsorted(knots, t, side="right") - 1
+    return np.clip(spans, degree, count - 1)
+
+
+def _basis_functions(knots, degree, spans, t):
+    # The degree + 1 non-zero B-spline basis functions at each t (Cox-de Boor
+    # in the triangular form), evaluated for all t together.
+    basis = np.zeros((len(t), degree + 1))
+    basis[:, 0] = 1.0
+    left = np.zeros((len(t), degree + 1))
+    right = np.zeros((len(t), degree + 1))
+
+    for j in range(1, degree + 1):
+        left[:, j] = t - knots[spans + 1 - j]
+        right[:, j] = knots[spans + j] - t
+        saved = np.zeros(len(t))
+        for r in range(j):
+            temp = basis[:, r] / (right[:, r + 1] + left[:, j - r])
+            basis[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        basis[:, j] = saved
+
+    return basis
+
+
+def nurbs_evaluate(points, t, degree=3, weights=None, knots=None):
+    control = _control(points)
+    count = len(control)
+    degree = min(degree, count - 1)
+
+    weights = np.ones(count) if weights is None else np.asarray(weights, float)
+    knots = clamped_knots(count, degree) if knots is None else np.asarray(knots)
+    t = np.asarray(t, dtype=float)
+
+    spans = _find_spans(knots, degree, count, t)
+    basis = _basis_functions(knots, degree, spans, t)
+    indices = spans[:, None] - degree + np.arange(degree + 1)
+
+    weighted = basis * weights[indices]
+    numerator = np.einsum("ij,ijk->ik", weighted, control[indices])
+    return numerator / weighted.sum(axis=1)[:, None]
+
+
+def nurbs_points(points, degree=3, weights=None, knots=None, steps=20):
+    count = len(points)
+    if count < 2:
+        return np.empty((0, 2))
+
+    degree = min(degree, count - 1)
+    knots = clamped_knots(count, degree) if knots is None else np.asarray(knots)
+    start, end = knots[degree], knots[count]
+    pieces = max(1, count - degree)
+    t = start + (end - start) * _parameters(steps * pieces)
+    return nurbs_evaluate(points, t, degree, weights, knots)
+
+
+def nurbs_curve(
+    points, degree=3, weights=None, knots=None, steps=20, connected=False, bounds=None
+):
+    samples = nurbs_points(points, degree, weights, knots, steps)
+    yield from curve_cells(samples, connected, bounds)
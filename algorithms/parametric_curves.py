@@ -1,58 +1,361 @@
+import functools
+from itertools import repeat
+
 import numpy as np
 
+from algorithms.spans import pixel_array
+from algorithms.straight_lines import bresenham_int_line
+
+HERMITE_MATRIX = np.array(
+    [[2, -2, 1, 1], [-3, 3, -2, -1], [0, 0, 1, 0], [1, 0, 0, 0]], dtype=float
+)
+BEZIER_MATRIX = np.array(
+    [[-1, 3, -3, 1], [3, -6, 3, 0], [-3, 3, 0, 0], [1, 0, 0, 0]], dtype=float
+)
+BSPLINE_MATRIX = (
+    np.array([[-1, 3, -3, 1], [3, -6, 3, 0], [-3, 0, 3, 0], [1, 4, 1, 0]]) / 6.0
+)
+
+
+@functools.lru_cache(maxsize=32)
+def power_basis(steps):
+    # Rows are [t^3, t^2, t, 1] for t = i / steps, i = 0..steps: a single
+    # t = 0 row for steps == 0 and none below that, like range(steps + 1).
+    if steps > 0:
+        t = np.arange(steps + 1) / steps
+    else:
+        t = np.zeros(max(0, steps + 1))
+    basis = t[:, None] ** np.arange(3, -1, -1)
+    basis.setflags(write=False)
+    return basis
+
+
+def _geometry(*points):
+    return np.array([(p[0], p[1]) for p in points], dtype=float)
+
+
+def _rounded(points):
+    cells = np.rint(points).astype(np.int64)
+    return zip(cells[:, 0].tolist(), cells[:, 1].tolist(), repeat(1.0))
+
+
+def _evaluate(coefficients, segments, t):
+    basis = t[:, None] ** np.arange(3, -1, -1)
+    return np.einsum("ij,ijk->ik", basis, coefficients[segments])
+
+
+def _piece_control_points(coefficients, t0, t1):
+    # Bezier control points of each cubic (power form, rows t^3..1) restricted
+    # to [t0, t1], via the substitution t = t0 + h * u.
+    c3, c2, c1, c0 = (coefficients[:, i] for i in range(4))
+    h = (t1 - t0)[:, None]
+    t = t0[:, None]
+
+    d0 = ((c3 * t + c2) * t + c1) * t + c0
+    d1 = h * ((3 * c3 * t + 2 * c2) * t + c1)
+    d2 = h * h * (3 * c3 * t + c2)
+    d3 = h * h * h * c3
 
-def hermite_curve(p0, p1, m0, m1, steps=20):
-    M = np.array([[2, -2, 1, 1], [-3, 3, -2, -1], [0, 0, 1, 0], [1, 0, 0, 0]])
+    return d0, d0 + d1 / 3, d0 + (2 * d1 + d2) / 3, d0 + d1 + d2 + d3
 
-    Gx = np.array([p0[0], p1[0], m0[0], m1[0]], dtype=float)
-    Gy = np.array([p0[1], p1[1], m0[1], m1[1]], dtype=float)
 
-    Cx = M.dot(Gx)
-    Cy = M.dot(Gy)
+def _distance_to_chord(p, a, b):
+    chord = b - a
+    length = np.hypot(chord[:, 0], chord[:, 1])
+    offset = p - a
+    cross = np.abs(chord[:, 0] * offset[:, 1] - chord[:, 1] * offset[:, 0])
+    return np.where(
+        length > 0,
+        cross / np.where(length > 0, length, 1.0),
+        np.hypot(offset[:, 0], offset[:, 1]),
+    )
 
-    for i in range(steps + 1):
-        t = i / steps if steps > 0 else 0.0
-        T = np.array([t**3, t**2, t, 1.0])
-        x: float = float(T.dot(Cx))
-        y: float = float(T.dot(Cy))
-        yield (round(x), round(y), 1.0)
 
+def adaptive_samples(coefficients, tolerance=0.5, max_chord=None, max_depth=20):
+    # Split every piece until its control polygon is within `tolerance` of the
+    # chord (and, optionally, the chord is at most `max_chord` long). All
+    # pieces at the same depth are tested together.
+    coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 4, 2)
+    count = len(coefficients)
 
-def bezier_curve(p0, p1, p2, p3, steps=20):
-    M = np.array([[-1, 3, -3, 1], [3, -6, 3, 0], [-3, 3, 0, 0], [1, 0, 0, 0]])
+    segments = np.arange(count)
+    t0 = np.zeros(count)
+    t1 = np.ones(count)
+    done_segments = [segments]
+    done_t = [np.ones(count)]
 
-    Gx = np.array([p0[0], p1[0], p2[0], p3[0]], dtype=float)
-    Gy = np.array([p0[1], p1[1], p2[1], p3[1]], dtype=float)
+    for depth in range(max_depth + 1):
+        b0, b1, b2, b3 = _piece_control_points(coefficients[segments], t0, t1)
+        flat = (
+            np.maximum(_distance_to_chord(b1, b0, b3), _distance_to_chord(b2, b0, b3))
+            <= tolerance
+        )
+        if max_chord is not None:
+            chord = b3 - b0
+            flat &= np.hypot(chord[:, 0], chord[:, 1]) <= max_chord
+        if depth == max_depth:
+            flat[:] = True
 
-    Cx = M.dot(Gx)
-    Cy = M.dot(Gy)
+        done_segments.append(segments[flat])
+        done_t.append(t0[flat])
 
-    for i in range(steps + 1):
-        t = i / steps if steps > 0 else 0.0
-        T = np.array([t**3, t**2, t, 1.0])
-        x: float = float(T.dot(Cx))
-        y: float = float(T.dot(Cy))
-        yield (round(x), round(y), 1.0)
+        split = ~flat
+        if not split.any():
+            break
+        mid = (t0[split] + t1[split]) / 2
+        segments = np.repeat(segments[split], 2)
+        t0, t1 = (
+            np.column_stack([t0[split], mid]).ravel(),
+            np.column_stack([mid, t1[split]]).ravel(),
+        )
 
+    segments = np.concatenate(done_segments)
+    t = np.concatenate(done_t)
+    order = np.lexsort((t, segments))
+    return _evaluate(coefficients, segments[order], t[order])
 
-def bspline_curve(points, steps=20):
+
+def hermite_points(p0, p1, m0, m1, steps=20, tolerance=None, max_chord=None):
+    coefficients = HERMITE_MATRIX @ _geometry(p0, p1, m0, m1)
+    if tolerance is not None:
+        return adaptive_samples(coefficients, tolerance, max_chord)
+    return power_basis(steps) @ coefficients
+
+
+def bezier_points(p0, p1, p2, p3, steps=20, tolerance=None, max_chord=None):
+    coefficients = BEZIER_MATRIX @ _geometry(p0, p1, p2, p3)
+    if tolerance is not None:
+        return adaptive_samples(coefficients, tolerance, max_chord)
+    return power_basis(steps) @ coefficients
+
+
+def bspline_points(points, steps=20, tolerance=None, max_chord=None):
     if len(points) < 4:
+        return np.empty((0, 2))
+
+    control = _geometry(*points)
+    windows = np.lib.stride_tricks.sliding_window_view(control, 4, axis=0)
+    coefficients = BSPLINE_MATRIX @ windows.transpose(0, 2, 1)
+    if tolerance is not None:
+        return adaptive_samples(coefficients, tolerance, max_chord)
+    return (power_basis(steps) @ coefficients).reshape(-1, 2)
+
+
+class IncrementalBSpline:
+    # Uniform cubic B-spline that keeps one sample buffer per segment. A
+    # control point only influences the four segments around it, so moving
+    # it re-evaluates those and leaves the rest untouched.
+
+    def __init__(self, points, steps=20):
+        self.steps = steps
+        self.control = _geometry(*points)
+        count = max(0, len(self.control) - 3)
+        samples = max(0, steps + 1)
+        self.samples = np.empty((count, samples, 2))
+        self.cells = np.empty((count, samples, 2), dtype=np.int64)
+        self._evaluate(0, count)
+
+    def _evaluate(self, first, last):
+        if first >= last:
+            return
+        control = self.control[first : last + 3]
+        windows = np.lib.stride_tricks.sliding_window_view(control, 4, axis=0)
+        coefficients = BSPLINE_MATRIX @ windows.transpose(0, 2, 1)
+        self.samples[first:last] = power_basis(self.steps) @ coefficients
+        self.cells[first:last] = np.rint(self.samples[first:last])
+
+    def move_point(self, index, point):
+        # Returns the (first, last) range of segments that changed.
+        self.control[index] = (point[0], point[1])
+        first, last = max(0, index - 3), min(len(self.samples), index + 1)
+        self._evaluate(first, last)
+        return first, last
+
+    def points(self):
+        return self.samples.reshape(-1, 2)
+
+    def curve(self, connected=False, first=0, last=None):
+        # Cells of segments first..last - 1, by default all of them.
+        cells = self.cells[first:last].reshape(-1, 2)
+        cells = zip(cells[:, 0].tolist(), cells[:, 1].tolist(), repeat(1.0))
+        return connect_cells(cells) if connected else cells
+
+
+class BSplineRaster:
+    # The pixel_array of an IncrementalBSpline's curve, kept as one block of
+    # spans per segment (plus a last block for the cell connect_cells holds
+    # back to the end), so that a moved control point only rasterizes the
+    # segments it touched. When connected, the joining state at the start
+    # of every segment is kept too; re-joining carries on past the moved
+    # segments until it is back in the old state, which keeps the result
+    # equal to joining the whole curve.
+
+    def __init__(self, spline, connected=False):
+        self.spline = spline
+        self.connected = connected
+        count = len(spline.samples)
+        self.blocks = [None] * (count + 1)
+        self.states = [(None, None, None)] * (count + 1)
+        self._rasterize(0, count + 1)
+        self.offsets = np.cumsum([0] + [len(block) for block in self.blocks])
+
+    def _segment(self, index):
+        cells = self.spline.curve(first=index, last=index + 1)
+        if not self.connected:
+            return pixel_array(cells), self.states[index]
+        state = list(self.states[index])
+        return pixel_array(list(_joined(cells, state))), tuple(state)
+
+    def _rasterize(self, first, last):
+        # Rebuilds blocks from `first` up to at least `last` and returns
+        # where it stopped.
+        count = len(self.spline.samples)
+        index = first
+        while index < count:
+            block, state = self._segment(index)
+            changed = state != self.states[index + 1]
+            self.blocks[index] = block
+            self.states[index + 1] = state
+            index += 1
+            if index >= last and not changed:
+                return index
+
+        held = self.states[count][2] if self.connected else None
+        self.blocks[count] = pixel_array([] if held is None else [held])
+        return count + 1
+
+    def spans(self):
+        return np.concatenate(self.blocks)
+
+    def move_point(self, index, point):
+        # Returns (start, stop, spans): the spans that take the place of
+        # spans()[start:stop] as it was before the move.
+        first, last = self.spline.move_point(index, point)
+        stop = self._rasterize(first, last)
+        sizes = np.cumsum([0] + [len(block) for block in self.blocks[first:stop]])
+
+        start, old_stop = self.offsets[first], self.offsets[stop]
+        self.offsets[stop + 1 :] += start + sizes[-1] - old_stop
+        self.offsets[first : stop + 1] = start + sizes
+        return start, old_stop, np.concatenate(self.blocks[first:stop])
+
+
+def _joined(cells, state):
+    # The body of connect_cells, resumable: `state` holds the previous input
+    # cell, the last emitted cell and the held one, and is left as it was
+    # after the last of `cells`. The held cell is not yielded.
+    previous, emitted, held = state
+
+    for x, y, _ in cells:
+        if previous is None:
+            steps = [(x, y, 1.0)]
+        else:
+            steps = bresenham_int_line(previous[0], previous[1], x, y)
+            next(steps)
+        previous = (x, y)
+
+        for cell in steps:
+            if held is None:
+                held = cell
+            elif cell[:2] == held[:2]:
+                continue
+            elif (
+                emitted is not None
+                and max(abs(cell[0] - emitted[0]), abs(cell[1] - emitted[1])) == 1
+            ):
+                held = cell
+            else:
+                yield held
+                emitted = held
+                held = cell
+
+    state[:] = previous, emitted, held
+
+
+def connect_cells(cells):
+    # Join consecutive cells with Bresenham segments into one 8-connected
+    # path. Repeated joint cells are skipped, and a cell is held back until
+    # the next one arrives so that an L-shaped corner left at a joint (its
+    # neighbours already touch diagonally) can be dropped.
+    state = [None, None, None]
+    yield from _joined(cells, state)
+    if state[2] is not None:
+        yield state[2]
+
+
+def _chord_runs(cells, bounds, margin=3):
+    # (first, last) index pairs of the stretches of consecutive cells whose
+    # chords come within `margin` cells of `bounds`. The margin lets joining
+    # settle into much the same corners as it would on the whole curve by
+    # the time it gets into view; a staircase may still come out shifted.
+    x_min, y_min, x_max, y_max = bounds
+    low = np.minimum(cells[:-1], cells[1:]) - margin
+    high = np.maximum(cells[:-1], cells[1:]) + margin
+    visible = (
+        (high[:, 0] >= x_min)
+        & (low[:, 0] <= x_max)
+        & (high[:, 1] >= y_min)
+        & (low[:, 1] <= y_max)
+    )
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], visible, [0]])))
+    return zip(edges[::2].tolist(), (edges[1::2] + 1).tolist())
+
+
+def _clipped_cells(points, connected, bounds):
+    cells = np.rint(points).reshape(-1, 2)
+    if connected and len(cells) > 1:
+        for first, last in _chord_runs(cells, bounds):
+            yield from connect_cells(_rounded(cells[first:last]))
         return
 
-    M = np.array([[-1, 3, -3, 1], [3, -6, 3, 0], [-3, 0, 3, 0], [1, 4, 1, 0]]) / 6.0
+    x_min, y_min, x_max, y_max = bounds
+    x, y = cells[:, 0], cells[:, 1]
+    yield from _rounded(
+        cells[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)]
+    )
+
+
+def curve_cells(points, connected=False, bounds=None):
+    # With `bounds`, cells that cannot fall inside it are left out; a joined
+    # path starts over each time the curve comes back into view.
+    if bounds is not None:
+        return _clipped_cells(points, connected, bounds)
+    cells = _rounded(points)
+    return connect_cells(cells) if connected else cells
+
+
+def hermite_curve(
+    p0,
+    p1,
+    m0,
+    m1,
+    steps=20,
+    tolerance=None,
+    max_chord=None,
+    connected=False,
+    bounds=None,
+):
+    points = hermite_points(p0, p1, m0, m1, steps, tolerance, max_chord)
+    yield from curve_cells(points, connected, bounds)
 
-    for seg in range(len(points) - 3):
-        p0, p1, p2, p3 = points[seg], points[seg + 1], points[seg + 2], points[seg + 3]
 
-        Gx = np.array([p0[0], p1[0], p2[0], p3[0]], dtype=float)
-        Gy = np.array([p0[1], p1[1], p2[1], p3[1]], dtype=float)
+def bezier_curve(
+    p0,
+    p1,
+    p2,
+    p3,
+    steps=20,
+    tolerance=None,
+    max_chord=None,
+    connected=False,
+    bounds=None,
+):
+    points = bezier_points(p0, p1, p2, p3, steps, tolerance, max_chord)
+    yield from curve_cells(points, connected, bounds)
 
-        Cx = M.dot(Gx)
-        Cy = M.dot(Gy)
 
-        for i in range(steps + 1):
-            t = i / steps if steps > 0 else 0.0
-            T = np.array([t**3, t**2, t, 1.0])
-            x: float = float(T.dot(Cx))
-            y: float = float(T.dot(Cy))
-            yield (round(x), round(y), 1.0)
+def bspline_curve(
+    points, steps=20, tolerance=None, max_chord=None, connected=False, bounds=None
+):
+    samples = bspline_points(points, steps, tolerance, max_chord)
+    yield from curve_cells(samples, connected, bounds)
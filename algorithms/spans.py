@@ -0,0 +1,99 @@
+import itertools
+
+import numpy as np
+
+SPAN_DTYPE = np.dtype(
+    [("y", np.int32), ("x_start", np.int32), ("x_end", np.int32), ("alpha", np.uint8)]
+)
+CHUNK_SIZE = 1 << 16
+
+
+def pixels_to_spans(pixels):
+    run = None
+
+    for x, y, opacity in pixels:
+        if run is not None and run[0] == y and run[3] == opacity:
+            if x == run[2] + 1:
+                run[2] = x
+                continue
+            if x == run[1] - 1:
+                run[1] = x
+                continue
+
+        if run is not None:
+            yield tuple(run)
+        run = [y, x, x, opacity]
+
+    if run is not None:
+        yield tuple(run)
+
+
+def spans_to_pixels(spans):
+    for y, x_start, x_end, opacity in spans:
+        for x in range(x_start, x_end + 1):
+            yield (x, y, opacity)
+
+
+def span_cells(spans):
+    rows = spans["y"].astype(np.int64)
+    x_start = spans["x_start"].astype(np.int64)
+    widths = spans["x_end"] - x_start + 1
+
+    index = np.repeat(np.arange(len(spans)), widths)
+    offsets = np.arange(len(index)) - np.repeat(np.cumsum(widths) - widths, widths)
+    return x_start[index] + offsets, rows[index], spans["alpha"][index] / 255.0
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = iter(items)
+    while True:
+        block = list(itertools.islice(items, size))
+        if not block:
+            return
+        yield np.array(block, dtype=float).reshape(len(block), -1)
+
+
+def _pack(y, x_start, x_end, opacity):
+    spans = np.empty(len(y), SPAN_DTYPE)
+    spans["y"] = y
+    spans["x_start"] = x_start
+    spans["x_end"] = x_end
+    spans["alpha"] = np.rint(np.clip(opacity, 0.0, 1.0) * 255)
+    return spans
+
+
+def _concatenate(chunks):
+    chunks = list(chunks)
+    if not chunks:
+        return np.empty(0, SPAN_DTYPE)
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def packed_chunks(items, spans=False, size=CHUNK_SIZE):
+    # SPAN_DTYPE arrays of at most `size` entries, read lazily from `items`:
+    # (y, x_start, x_end, opacity) spans, (x, y, opacity) pixels that
+    # become one-cell spans, or SPAN_DTYPE arrays packed already.
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        return
+    items = itertools.chain([first], items)
+    if isinstance(first, np.ndarray):
+        for packed in items:
+            for start in range(0, len(packed), size):
+                yield packed[start : start + size]
+        return
+
+    for block in _chunks(items, size):
+        if spans:
+            yield _pack(block[:, 0], block[:, 1], block[:, 2], block[:, 3])
+        else:
+            yield _pack(block[:, 1], block[:, 0], block[:, 0], block[:, 2])
+
+
+def span_array(spans):
+    return _concatenate(packed_chunks(spans, spans=True))
+
+
+def pixel_array(pixels):
+    return _concatenate(packed_chunks(pixels))
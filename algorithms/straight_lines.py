@@ -1,14 +1,32 @@
 import math
 
+import numpy as np
 
-def dda_line(x1, y1, x2, y2):
+from algorithms.clipping import clip_steps, in_rect, liang_barsky
+from algorithms.spans import pixels_to_spans
+
+
+def _advance(value, inc, count, chunk=1 << 16):
+    # Same result as running `value += inc` `count` times, bit for bit, but
+    # the additions happen inside NumPy instead of one generator step each.
+    while count > 0:
+        n = min(count, chunk)
+        block = np.full(n + 1, inc)
+        block[0] = value
+        value = float(np.add.accumulate(block)[-1])
+        count -= n
+    return value
+
+
+def dda_line(x1, y1, x2, y2, clip=None):
     dx = x2 - x1
     dy = y2 - y1
 
     steps = max(abs(dx), abs(dy))
 
     if steps == 0:
-        yield (round(x1), round(y1), 1.0)
+        if clip is None or in_rect(round(x1), round(y1), clip):
+            yield (round(x1), round(y1), 1.0)
         return
 
     x_inc = dx / steps
@@ -16,14 +34,24 @@ def dda_line(x1, y1, x2, y2):
 
     x = x1
     y = y1
-
-    for i in range(int(steps) + 1):
-        yield (round(x), round(y), 1.0)
+    first, last = 0, int(steps)
+
+    if clip is not None:
+        span = clip_steps(x1, y1, x2, y2, steps, clip)
+        if span is None:
+            return
+        first, last = span
+        x = _advance(x, x_inc, first)
+        y = _advance(y, y_inc, first)
+
+    for i in range(first, last + 1):
+        if clip is None or in_rect(round(x), round(y), clip):
+            yield (round(x), round(y), 1.0)
         x += x_inc
         y += y_inc
 
 
-def bresenham_int_line(x1, y1, x2, y2):
+def bresenham_int_line(x1, y1, x2, y2, clip=None):
     dx = abs(x2 - x1)
     dy = abs(y2 - y1)
 
@@ -33,13 +61,37 @@ def bresenham_int_line(x1, y1, x2, y2):
     err = dx - dy
 
     x, y = x1, y1
+    remaining = None
+
+    if clip is not None:
+        major = max(dx, dy)
+        span = clip_steps(x1, y1, x2, y2, major, clip)
+        if span is None:
+            return
+        first, last = span
+        remaining = last - first
+
+        # Jump straight to step `first`: the walk's position there has a
+        # closed form, and the error term follows from the steps taken.
+        minor = min(dx, dy)
+        m = (2 * first * minor + major - 1) // (2 * major) if major else 0
+        nx, ny = (first, m) if dx >= dy else (m, first)
+        x = x1 + sx * nx
+        y = y1 + sy * ny
+        err = dx - dy - nx * dy + ny * dx
 
     while True:
-        yield (x, y, 1.0)
+        if clip is None or in_rect(x, y, clip):
+            yield (x, y, 1.0)
 
         if x == x2 and y == y2:
             break
 
+        if remaining is not None:
+            if remaining == 0:
+                break
+            remaining -= 1
+
         e2 = 2 * err
 
         if e2 > -dy:
@@ -51,7 +103,11 @@ def bresenham_int_line(x1, y1, x2, y2):
             y += sy
 
 
-def wu_line(x1, y1, x2, y2):
+def bresenham_line_spans(x1, y1, x2, y2, clip=None):
+    return pixels_to_spans(bresenham_int_line(x1, y1, x2, y2, clip=clip))
+
+
+def wu_line(x1, y1, x2, y2, clip=None):
 
     def fpart(x):
         return x - math.floor(x)
@@ -68,7 +124,13 @@ def wu_line(x1, y1, x2, y2):
         if y1 > y2:
             y1, y2 = y2, y1
         x = round(x1)
-        for y in range(int(y1), int(y2) + 1):
+        y_first, y_last = int(y1), int(y2)
+        if clip is not None:
+            if not clip[0] <= x <= clip[2]:
+                return
+            y_first = max(y_first, clip[1])
+            y_last = min(y_last, clip[3])
+        for y in range(y_first, y_last + 1):
             yield (x, y, 1.0)
         return
 
@@ -85,6 +147,9 @@ def wu_line(x1, y1, x2, y2):
 
     gradient = dy / dx if abs(dx) > 0.001 else 1.0
 
+    def visible(px, py):
+        return clip is None or in_rect(px, py, clip)
+
     xend = round(x1)
     yend = y1 + gradient * (xend - x1)
     xgap = rfpart(x1 + 0.5)
@@ -92,11 +157,15 @@ def wu_line(x1, y1, x2, y2):
     ypxl1 = int(math.floor(yend))
 
     if steep:
-        yield (ypxl1, xpxl1, rfpart(yend) * xgap)
-        yield (ypxl1 + 1, xpxl1, fpart(yend) * xgap)
+        ends = [
+            (ypxl1, xpxl1, rfpart(yend) * xgap),
+            (ypxl1 + 1, xpxl1, fpart(yend) * xgap),
+        ]
     else:
-        yield (xpxl1, ypxl1, rfpart(yend) * xgap)
-        yield (xpxl1, ypxl1 + 1, fpart(yend) * xgap)
+        ends = [
+            (xpxl1, ypxl1, rfpart(yend) * xgap),
+            (xpxl1, ypxl1 + 1, fpart(yend) * xgap),
+        ]
 
     intery = yend + gradient
 
@@ -107,17 +176,220 @@ def wu_line(x1, y1, x2, y2):
     ypxl2 = int(math.floor(yend))
 
     if steep:
-        yield (ypxl2, xpxl2, rfpart(yend) * xgap)
-        yield (ypxl2 + 1, xpxl2, fpart(yend) * xgap)
+        ends += [
+            (ypxl2, xpxl2, rfpart(yend) * xgap),
+            (ypxl2 + 1, xpxl2, fpart(yend) * xgap),
+        ]
     else:
-        yield (xpxl2, ypxl2, rfpart(yend) * xgap)
-        yield (xpxl2, ypxl2 + 1, fpart(yend) * xgap)
+        ends += [
+            (xpxl2, ypxl2, rfpart(yend) * xgap),
+            (xpxl2, ypxl2 + 1, fpart(yend) * xgap),
+        ]
+
+    for px, py, opacity in ends:
+        if visible(px, py):
+            yield (px, py, opacity)
+
+    x_first, x_last = xpxl1 + 1, xpxl2 - 1
 
-    for x in range(xpxl1 + 1, xpxl2):
+    if clip is not None:
+        xmin, ymin, xmax, ymax = clip
         if steep:
-            yield (int(math.floor(intery)), x, rfpart(intery))
-            yield (int(math.floor(intery)) + 1, x, fpart(intery))
+            xmin, ymin, xmax, ymax = ymin, xmin, ymax, xmax
+        t = liang_barsky(x1, y1, x2, y2, xmin - 2, ymin - 2, xmax + 2, ymax + 2)
+        if t is None:
+            return
+        x_first = max(x_first, math.floor(x1 + t[0] * (x2 - x1)))
+        x_last = min(x_last, math.ceil(x1 + t[1] * (x2 - x1)))
+        intery = _advance(intery, gradient, x_first - xpxl1 - 1)
+
+    for x in range(x_first, x_last + 1):
+        if steep:
+            px, py = int(math.floor(intery)), x
+            if visible(px, py):
+                yield (px, py, rfpart(intery))
+            if visible(px + 1, py):
+                yield (px + 1, py, fpart(intery))
         else:
-            yield (x, int(math.floor(intery)), rfpart(intery))
-            yield (x, int(math.floor(intery)) + 1, fpart(intery))
+            px, py = x, int(math.floor(intery))
+            if visible(px, py):
+                yield (px, py, rfpart(intery))
+            if visible(px, py + 1):
+                yield (px, py + 1, fpart(intery))
         intery += gradient
+
+
+def _as_segments(segments, dtype):
+    return np.asarray(segments, dtype=dtype).reshape(-1, 4)
+
+
+def _ramp(counts):
+    ids = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    steps = np.arange(len(ids)) - starts[ids]
+    return ids, steps
+
+
+def _accumulate(start, inc, counts):
+    # Same sequential `value += inc` as the generators, so the float rounding
+    # (and therefore every rounded pixel) is identical. Segments are grouped
+    # by length so each group is a single cumsum over a 2-D block.
+    values = np.empty(int(counts.sum()))
+    offsets = np.cumsum(counts) - counts
+
+    order = np.argsort(counts, kind="stable")
+    bounds = np.flatnonzero(np.diff(counts[order])) + 1
+    for rows in np.split(order, bounds):
+        n = int(counts[rows[0]]) if len(rows) else 0
+        if n == 0:
+            continue
+        block = np.empty((len(rows), n))
+        block[:, 0] = start[rows]
+        block[:, 1:] = inc[rows, None]
+        np.cumsum(block, axis=1, out=block)
+        values[(offsets[rows, None] + np.arange(n)).ravel()] = block.ravel()
+
+    return values
+
+
+def dda_line_batch(segments):
+    seg = _as_segments(segments, float)
+    x1, y1, x2, y2 = seg.T
+
+    dx = x2 - x1
+    dy = y2 - y1
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    counts = np.floor(steps).astype(np.int64) + 1
+
+    safe_steps = np.where(steps == 0, 1.0, steps)
+    x_inc = np.where(steps == 0, 0.0, dx / safe_steps)
+    y_inc = np.where(steps == 0, 0.0, dy / safe_steps)
+
+    ids, _ = _ramp(counts)
+    x = np.rint(_accumulate(x1, x_inc, counts)).astype(np.int64)
+    y = np.rint(_accumulate(y1, y_inc, counts)).astype(np.int64)
+
+    return x, y, np.ones(len(ids)), ids
+
+
+def bresenham_line_batch(segments):
+    seg = _as_segments(segments, np.int64)
+    x1, y1, x2, y2 = seg.T
+
+    dx = np.abs(x2 - x1)
+    dy = np.abs(y2 - y1)
+    sx = np.where(x1 < x2, 1, -1)
+    sy = np.where(y1 < y2, 1, -1)
+
+    major = np.maximum(dx, dy)
+    minor = np.minimum(dx, dy)
+    x_major = dx >= dy
+
+    ids, i = _ramp(major + 1)
+    major_i = major[ids]
+    # Closed form of the error-term walk in `bresenham_int_line`: the minor
+    # coordinate is i * minor / major rounded, with ties rounded down.
+    m = np.where(
+        major_i > 0,
+        (2 * i * minor[ids] + major_i - 1) // np.maximum(2 * major_i, 1),
+        0,
+    )
+
+    x = x1[ids] + sx[ids] * np.where(x_major[ids], i, m)
+    y = y1[ids] + sy[ids] * np.where(x_major[ids], m, i)
+
+    return x, y, np.ones(len(ids)), ids
+
+
+def wu_line_batch(segments):
+    seg = _as_segments(segments, float)
+    x1, y1, x2, y2 = seg.T.copy()
+
+    def fpart(x):
+        return x - np.floor(x)
+
+    def rfpart(x):
+        return 1 - fpart(x)
+
+    dx = x2 - x1
+    dy = y2 - y1
+
+    vertical = np.abs(dx) < 0.001
+    steep = ~vertical & (np.abs(dy) > np.abs(dx))
+
+    # Vertical segments: a plain column of full-opacity cells.
+    v_x = np.rint(x1)
+    v_y0 = np.trunc(np.minimum(y1, y2))
+    v_y1 = np.trunc(np.maximum(y1, y2))
+    v_counts = np.maximum(0, v_y1 - v_y0 + 1).astype(np.int64)
+
+    ax1 = np.where(steep, y1, x1)
+    ay1 = np.where(steep, x1, y1)
+    ax2 = np.where(steep, y2, x2)
+    ay2 = np.where(steep, x2, y2)
+    adx = np.where(steep, dy, dx)
+    ady = np.where(steep, dx, dy)
+
+    swap = ax1 > ax2
+    ax1, ax2 = np.where(swap, ax2, ax1), np.where(swap, ax1, ax2)
+    ay1, ay2 = np.where(swap, ay2, ay1), np.where(swap, ay1, ay2)
+
+    gradient = np.where(vertical, 0.0, ady / np.where(vertical, 1.0, adx))
+
+    xend1 = np.rint(ax1)
+    yend1 = ay1 + gradient * (xend1 - ax1)
+    xgap1 = rfpart(ax1 + 0.5)
+    xpxl1 = xend1.astype(np.int64)
+    ypxl1 = np.floor(yend1).astype(np.int64)
+
+    xend2 = np.rint(ax2)
+    yend2 = ay2 + gradient * (xend2 - ax2)
+    xgap2 = fpart(ax2 + 0.5)
+    xpxl2 = xend2.astype(np.int64)
+    ypxl2 = np.floor(yend2).astype(np.int64)
+
+    inner = np.where(vertical, 0, np.maximum(0, xpxl2 - xpxl1 - 1))
+    counts = np.where(vertical, v_counts, 4 + 2 * inner)
+
+    total = int(counts.sum())
+    offsets = np.cumsum(counts) - counts
+    major = np.empty(total, dtype=np.int64)
+    minor = np.empty(total, dtype=np.int64)
+    alpha = np.empty(total)
+
+    g = np.flatnonzero(~vertical)
+    base = offsets[g]
+    ends = [
+        (base, xpxl1, ypxl1, rfpart(yend1) * xgap1),
+        (base + 1, xpxl1, ypxl1 + 1, fpart(yend1) * xgap1),
+        (base + 2, xpxl2, ypxl2, rfpart(yend2) * xgap2),
+        (base + 3, xpxl2, ypxl2 + 1, fpart(yend2) * xgap2),
+    ]
+    for pos, mj, mn, a in ends:
+        major[pos] = mj[g]
+        minor[pos] = mn[g]
+        alpha[pos] = a[g]
+
+    intery = _accumulate(yend1 + gradient, gradient, inner)
+    ids, k = _ramp(inner)
+    pos = offsets[ids] + 4 + 2 * k
+    floor_y = np.floor(intery).astype(np.int64)
+    major[pos] = xpxl1[ids] + 1 + k
+    minor[pos] = floor_y
+    alpha[pos] = rfpart(intery)
+    major[pos + 1] = xpxl1[ids] + 1 + k
+    minor[pos + 1] = floor_y + 1
+    alpha[pos + 1] = fpart(intery)
+
+    ids = np.repeat(np.arange(len(counts)), counts)
+    steep_px = steep[ids]
+    x = np.where(steep_px, minor, major)
+    y = np.where(steep_px, major, minor)
+
+    v_ids, v_k = _ramp(np.where(vertical, v_counts, 0))
+    v_pos = offsets[v_ids] + v_k
+    x[v_pos] = v_x[v_ids].astype(np.int64)
+    y[v_pos] = v_y0[v_ids].astype(np.int64) + v_k
+    alpha[v_pos] = 1.0
+
+    return x, y, alpha, ids
@@ -0,0 +1,249 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from algorithms.conics import (
+    bresenham_circle,
+    bresenham_circle_spans,
+    clear_conic_cache,
+    midpoint_ellipse,
+    midpoint_ellipse_spans,
+    midpoint_hyperbola,
+    midpoint_parabola,
+)
+from algorithms.nurbs import bezier_n_curve, nurbs_curve
+from algorithms.parametric_curves import bezier_curve, bspline_curve, hermite_curve
+from algorithms.straight_lines import (
+    bresenham_int_line,
+    bresenham_line_spans,
+    dda_line,
+    wu_line,
+)
+
+# Relative change past which compare mode reports a regression.
+DEFAULT_THRESHOLD = 0.25
+# Short cases are run back to back until at least this long has passed, so
+# their throughput is not mostly timer noise.
+MIN_SECONDS = 1e-3
+# metric -> (higher is better, smallest absolute change that is not noise)
+METRICS = {
+    "pixels_per_second": (True, 0),
+    "first_pixel_seconds": (False, 50e-6),
+    "peak_bytes": (False, 4096),
+}
+CURVE_POINTS = [(0, 0), (300, 900), (900, -400), (1500, 600), (2100, 0), (2400, 800)]
+
+# name -> {size: (factory, spans)}; each factory returns a fresh generator.
+CASES = {
+    "dda_line": {
+        "short": (lambda: dda_line(0, 0, 70, 40), False),
+        "long": (lambda: dda_line(0, 0, 200000, 70000), False),
+    },
+    "bresenham_int_line": {
+        "short": (lambda: bresenham_int_line(0, 0, 70, 40), False),
+        "long": (lambda: bresenham_int_line(0, 0, 200000, 70000), False),
+    },
+    "bresenham_line_spans": {
+        "short": (lambda: bresenham_line_spans(0, 0, 70, 40), True),
+        "long": (lambda: bresenham_line_spans(0, 0, 200000, 70000), True),
+    },
+    "wu_line": {
+        "short": (lambda: wu_line(0, 0, 70, 40), False),
+        "long": (lambda: wu_line(0, 0, 200000, 70000), False),
+    },
+    "bresenham_circle": {
+        "small": (lambda: bresenham_circle(0, 0, 50), False),
+        "huge": (lambda: bresenham_circle(0, 0, 100000), False),
+    },
+    "bresenham_circle_spans": {
+        "small": (lambda: bresenham_circle_spans(0, 0, 50), True),
+        "huge": (lambda: bresenham_circle_spans(0, 0, 100000), True),
+    },
+    "midpoint_ellipse": {
+        "small": (lambda: midpoint_ellipse(0, 0, 60, 35), False),
+        "huge": (lambda: midpoint_ellipse(0, 0, 120000, 70000), False),
+    },
+    "midpoint_ellipse_spans": {
+        "small": (lambda: midpoint_ellipse_spans(0, 0, 60, 35), True),
+        "huge": (lambda: midpoint_ellipse_spans(0, 0, 120000, 70000), True),
+    },
+    "midpoint_hyperbola": {
+        "small": (lambda: midpoint_hyperbola(0, 0, 20, 15), False),
+        "huge": (lambda: midpoint_hyperbola(0, 0, 20, 15, limit=200000), False),
+    },
+    "midpoint_parabola": {
+        "small": (lambda: midpoint_parabola(0, 0, 10), False),
+        "huge": (lambda: midpoint_parabola(0, 0, 10, limit=200000), False),
+    },
+    "hermite_curve": {
+        "low": (lambda: hermite_curve(*CURVE_POINTS[:4], steps=20), False),
+        "high": (
+            lambda: hermite_curve(*CURVE_POINTS[:4], steps=20000, connected=True),
+            False,
+        ),
+    },
+    "bezier_curve": {
+        "low": (lambda: bezier_curve(*CURVE_POINTS[:4], steps=20), False),
+        "high": (
+            lambda: bezier_curve(*CURVE_POINTS[:4], steps=20000, connected=True),
+            False,
+        ),
+    },
+    "bspline_curve": {
+        "low": (lambda: bspline_curve(CURVE_POINTS, steps=20), False),
+        "high": (
+            lambda: bspline_curve(CURVE_POINTS, steps=20000, connected=True),
+            False,
+        ),
+    },
+    "bezier_n_curve": {
+        "low": (lambda: bezier_n_curve(CURVE_POINTS, steps=20), False),
+        "high": (
+            lambda: bezier_n_curve(CURVE_POINTS, steps=20000, connected=True),
+            False,
+        ),
+    },
+    "nurbs_curve": {
+        "low": (lambda: nurbs_curve(CURVE_POINTS, steps=20), False),
+        "high": (
+            lambda: nurbs_curve(CURVE_POINTS, steps=20000, connected=True),
+            False,
+        ),
+    },
+}
+
+
+def _drain(generator, spans):
+    if spans:
+        return sum(x_end - x_start + 1 for _, x_start, x_end, _ in generator)
+    return sum(1 for _ in generator)
+
+
+def measure(factory, spans, repeat=3):
+    # Best of `repeat` runs for the timings (each averaged over enough
+    # back-to-back runs to last MIN_SECONDS), then one more under tracemalloc
+    # (which slows everything down) for peak memory.
+    total = first = float("inf")
+    pixels = 0
+    for _ in range(repeat):
+        runs = 0
+        elapsed = 0.0
+        while runs == 0 or elapsed < MIN_SECONDS:
+            clear_conic_cache()
+            generator = factory()
+            start = time.perf_counter()
+            head = next(generator, None)
+            if runs == 0:
+                first = min(first, time.perf_counter() - start)
+            pixels = _drain(generator, spans)
+            elapsed += time.perf_counter() - start
+            runs += 1
+        total = min(total, elapsed / runs)
+        if head is not None:
+            pixels += head[2] - head[1] + 1 if spans else 1
+
+    clear_conic_cache()
+    tracemalloc.start()
+    try:
+        _drain(factory(), spans)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "pixels": pixels,
+        "seconds": total,
+        "pixels_per_second": pixels / total if total > 0 else float("inf"),
+        "first_pixel_seconds": first,
+        "peak_bytes": peak,
+    }
+
+
+def run(pattern=None, repeat=3, log=None):
+    results = {}
+    for name, sizes in CASES.items():
+        for size, (factory, spans) in sizes.items():
+            key = f"{name}[{size}]"
+            if pattern and pattern not in key:
+                continue
+            results[key] = measure(factory, spans, repeat)
+            if log is not None:
+                log(key, results[key])
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    # (key, metric, baseline value, new value) for every metric that got
+    # worse by more than `threshold`, relative to the baseline.
+    regressions = []
+    for key, new in results["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        for metric, (higher_is_better, noise) in METRICS.items():
+            if higher_is_better:
+                worse = new[metric] < old[metric] * (1 - threshold)
+            else:
+                worse = new[metric] > old[metric] * (1 + threshold)
+            if worse and abs(new[metric] - old[metric]) > noise:
+                regressions.append((key, metric, old[metric], new[metric]))
+    return regressions
+
+
+def _print_result(key, result):
+    print(
+        f"{key:36} {result['pixels']:>10} px "
+        f"{result['pixels_per_second'] / 1e6:>8.2f} Mpx/s "
+        f"first {result['first_pixel_seconds'] * 1e6:>9.1f} us "
+        f"peak {result['peak_bytes'] / 1024:>9.1f} KiB",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the raster algorithms.")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative change that counts as a regression (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case")
+    parser.add_argument("-k", dest="pattern", help="only cases containing this")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    results = run(args.pattern, args.repeat, log=_print_result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline is None:
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old:.6g} -> {new:.6g}", file=sys.stderr)
+    if not regressions:
+        print("No regressions", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from algorithms.spans import SPAN_DTYPE
+from scene.export import WRITERS, export_image
+from scene.scene import RASTER_BUDGET
+from scene.scene_file import load_scene, save_scene, write_scene
+from scene.shapes import shape_from_spec
+
+DUMP_EXTENSIONS = (".gescene", ".npy")
+
+
+def read_specs(path):
+    # One shape spec per line, as Shape.spec() writes it; blank lines and
+    # lines starting with # are skipped.
+    specs = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                spec = json.loads(line)
+                shape_from_spec(spec)
+            except (ValueError, KeyError, TypeError) as error:
+                raise ValueError(f"{path}:{number}: {error}") from None
+            specs.append(spec)
+    return specs
+
+
+def rasterize_chunk(specs):
+    return [shape_from_spec(spec).rasterize() for spec in specs]
+
+
+def render_scene(specs, path, workers=None, chunk_size=None, budget=RASTER_BUDGET):
+    # Shapes are rasterized in chunks across worker processes and streamed,
+    # in input order, into the scene file at `path`. The scene returned
+    # pages them back in from there, so however small `budget` is nothing
+    # has to be rasterized a second time.
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, len(specs) // (workers * 4))
+    chunks = [specs[i : i + chunk_size] for i in range(0, len(specs), chunk_size)]
+
+    with ProcessPoolExecutor(workers) as executor:
+        rasters = itertools.chain.from_iterable(executor.map(rasterize_chunk, chunks))
+        write_scene(path, zip(map(shape_from_spec, specs), rasters))
+    return load_scene(path, budget)
+
+
+def write_output(path, scene, cell_px=4, grid=False, bounds=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".gescene":
+        save_scene(path, scene)
+    elif extension == ".npy":
+        total = sum(len(scene.raster(i)) for i in range(len(scene)))
+        dump = np.lib.format.open_memmap(path, "w+", SPAN_DTYPE, (total,))
+        start = 0
+        for i in range(len(scene)):
+            spans = scene.raster(i)
+            dump[start : start + len(spans)] = spans
+            start += len(spans)
+        dump.flush()
+    else:
+        export_image(path, scene, bounds, cell_px, grid)
+
+
+def main(argv=None):
+    formats = ", ".join(sorted(WRITERS) + list(DUMP_EXTENSIONS))
+    parser = argparse.ArgumentParser(
+        description="Rasterize a JSON Lines file of shape specs without a display."
+    )
+    parser.add_argument("specs", help="JSON Lines file, one shape spec per line")
+    parser.add_argument(
+        "-o",
+        "--output",
+        action="append",
+        required=True,
+        help=f"image or pixel dump to write ({formats}); may be repeated",
+    )
+    parser.add_argument("-j", "--workers", type=int, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, help="shapes per worker task")
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=RASTER_BUDGET >> 20,
+        help="MiB of rasters kept in memory while writing (default: %(default)s)",
+    )
+    parser.add_argument("--cell-px", type=int, default=4, help="pixels per cell")
+    parser.add_argument("--grid", action="store_true", help="draw the cell grid")
+    parser.add_argument(
+        "--bounds",
+        type=int,
+        nargs=4,
+        metavar=("X_MIN", "Y_MIN", "X_MAX", "Y_MAX"),
+        help="cells to export (default: every shape)",
+    )
+    args = parser.parse_args(argv)
+
+    for output in args.output:
+        extension = os.path.splitext(output)[1].lower()
+        if extension not in WRITERS and extension not in DUMP_EXTENSIONS:
+            parser.error(f"unsupported output format: {output}")
+
+    try:
+        specs = read_specs(args.specs)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    # The rasters go straight into the first .gescene output, or into a
+    # temporary one, and every output is written from that file.
+    scenes = [output for output in args.output if output.lower().endswith(".gescene")]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = scenes[0] if scenes else os.path.join(temp_dir, "render.gescene")
+        start = time.perf_counter()
+        try:
+            scene = render_scene(
+                specs, path, args.workers, args.chunk_size, args.budget << 20
+            )
+        except OSError as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - start
+        print(f"Rasterized {len(scene)} shapes in {elapsed:.2f} s", file=sys.stderr)
+
+        outputs = list(args.output)
+        if scenes:
+            outputs.remove(path)
+        for output in outputs:
+            try:
+                write_output(output, scene, args.cell_px, args.grid, args.bounds)
+            except (OSError, ValueError) as error:
+                print(f"{output}: {error}", file=sys.stderr)
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from algorithms.spans import span_cells
+
+# The image is built one band of cell rows at a time, each at most
+# BAND_BYTES of cell alphas, and written out row by row as it is finished.
+BAND_BYTES = 16 << 20
+MAX_BAND_ROWS = 1024
+STAMP_CELLS = 1 << 22
+BACKGROUND = 255
+GRID_SHADE = 220
+
+
+class PgmWriter:
+    def __init__(self, file, width, height):
+        self.file = file
+        file.write(f"P5\n{width} {height}\n255\n".encode("ascii"))
+
+    def write(self, rows):
+        self.file.write(np.ascontiguousarray(rows).data)
+
+    def close(self):
+        pass
+
+
+class PbmWriter:
+    # One bit per pixel; anything darker than mid grey is black.
+
+    def __init__(self, file, width, height):
+        self.file = file
+        file.write(f"P4\n{width} {height}\n".encode("ascii"))
+
+    def write(self, rows):
+        self.file.write(np.packbits(rows < 128, axis=1).data)
+
+    def close(self):
+        pass
+
+
+class PngWriter:
+    # 8-bit greyscale; rows are deflated as they arrive and written out as
+    # IDAT chunks whenever the compressor hands something back.
+
+    def __init__(self, file, width, height):
+        self.file = file
+        self._deflate = zlib.compressobj(6)
+        file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, rows):
+        # Each row starts with its filter type; 0 leaves it unfiltered.
+        data = np.zeros((len(rows), rows.shape[1] + 1), np.uint8)
+        data[:, 1:] = rows
+        compressed = self._deflate.compress(data.data)
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        self._chunk(b"IDAT", self._deflate.flush())
+        self._chunk(b"IEND", b"")
+
+
+WRITERS = {".png": PngWriter, ".pgm": PgmWriter, ".pbm": PbmWriter}
+
+
+def scene_bounds(scene):
+    boxes = [box for box in (shape.bounds() for shape in scene.shapes) if box]
+    if not boxes:
+        return None
+    x_min, y_min, x_max, y_max = zip(*boxes)
+    return min(x_min), min(y_min), max(x_max), max(y_max)
+
+
+def _stamp(alpha, rows, cols, opacity):
+    # Same compounding as RasterLayer.stamp_cells: overlapping cells
+    # multiply their transparency.
+    flat, inverse = np.unique(rows * alpha.shape[1] + cols, return_inverse=True)
+    clear = np.ones(len(flat))
+    np.multiply.at(clear, inverse, 1.0 - opacity)
+    cells = alpha.reshape(-1)
+    cells[flat] = np.rint(255.0 - (255.0 - cells[flat]) * clear)
+
+
+def _band_spans(spans, y_min, y_max, x_min, x_max):
+    # `spans` is sorted by row.
+    first, last = np.searchsorted(spans["y"], [y_min, y_max + 1])
+    spans = spans[first:last]
+    spans = spans[(spans["x_end"] >= x_min) & (spans["x_start"] <= x_max)]
+    if len(spans):
+        spans = spans.copy()
+        np.maximum(spans["x_start"], x_min, out=spans["x_start"])
+        np.minimum(spans["x_end"], x_max, out=spans["x_end"])
+    return spans
+
+
+def _shade(alpha_row, base, cell_px):
+    coverage = np.repeat(alpha_row, cell_px) / 255.0
+    return np.rint(base * (1.0 - coverage)).astype(np.uint8)
+
+
+def render_rows(scene, bounds, cell_px=4, grid=False):
+    # Yields the image top to bottom as blocks of greyscale pixel rows, one
+    # block per cell row: black shapes on white, like the canvas draws them.
+    x_min, y_min, x_max, y_max = bounds
+    width = x_max - x_min + 1
+    band_rows = max(1, min(MAX_BAND_ROWS, BAND_BYTES // width))
+
+    boxes = {
+        index: box
+        for index, box in enumerate(shape.bounds() for shape in scene.shapes)
+        if box and box[0] <= x_max and box[2] >= x_min and box[1] <= y_max
+    }
+    pending = sorted(boxes, key=lambda index: boxes[index][3])
+    active = {}
+
+    base = np.full(width * cell_px, BACKGROUND, np.uint8)
+    if grid:
+        base[::cell_px] = GRID_SHADE
+
+    top = y_max
+    while top >= y_min:
+        bottom = max(y_min, top - band_rows + 1)
+
+        # Shapes join the sweep when the band first reaches their top row
+        # and keep their spans, sorted by row, until it passes their bottom.
+        while pending and boxes[pending[-1]][3] >= bottom:
+            index = pending.pop()
+            spans = scene.raster(index)
+            active[index] = spans[np.argsort(spans["y"], kind="stable")]
+
+        alpha = np.zeros((top - bottom + 1, width), np.uint8)
+        rows, cols, opacity = [], [], []
+        count = 0
+        for spans in active.values():
+            spans = _band_spans(spans, bottom, top, x_min, x_max)
+            if not len(spans):
+                continue
+            x, y, a = span_cells(spans)
+            rows.append(top - y)
+            cols.append(x - x_min)
+            opacity.append(a)
+            count += len(x)
+            if count >= STAMP_CELLS:
+                _stamp(alpha, *map(np.concatenate, (rows, cols, opacity)))
+                rows, cols, opacity = [], [], []
+                count = 0
+        if count:
+            _stamp(alpha, *map(np.concatenate, (rows, cols, opacity)))
+
+        for index in [i for i in active if boxes[i][1] >= bottom]:
+            del active[index]
+
+        for alpha_row in alpha:
+            block = np.empty((cell_px, width * cell_px), np.uint8)
+            block[:] = _shade(alpha_row, base, cell_px)
+            if grid:
+                block[0] = _shade(alpha_row, GRID_SHADE, cell_px)
+            yield block
+
+        top = bottom - 1
+
+
+def export_image(
+    path, scene, bounds=None, cell_px=4, grid=False, progress=None, cancelled=None
+):
+    # Writes the cells inside `bounds` (all shapes by default) to a PNG,
+    # PGM or PBM file, `cell_px` pixels per cell. `progress(rows, height)`
+    # is called after each cell row. Returns False, and leaves no file
+    # behind, if `cancelled()` turns true first.
+    writer_type = WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer_type is None:
+        raise ValueError(f"Unsupported image format: {path}")
+    if bounds is None:
+        bounds = scene_bounds(scene)
+    if bounds is None:
+        raise ValueError("The scene is empty")
+
+    width = (bounds[2] - bounds[0] + 1) * cell_px
+    height = (bounds[3] - bounds[1] + 1) * cell_px
+    done = 0
+
+    with open(path, "wb") as file:
+        writer = writer_type(file, width, height)
+        for block in render_rows(scene, bounds, cell_px, grid):
+            if cancelled is not None and cancelled():
+                break
+            writer.write(block)
+            done += len(block)
+            if progress is not None:
+                progress(done, height)
+        if done == height:
+            writer.close()
+
+    if done < height:
+        os.remove(path)
+        return False
+    return True
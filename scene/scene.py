@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+RASTER_BUDGET = 256 << 20
+
+
+class Scene:
+    # Shape descriptors in drawing order, with their rasterized spans
+    # memoized by index. Once the kept rasters add up to more than `budget`
+    # bytes the least recently used are dropped and rebuilt if asked for
+    # again. The newest shape is never dropped: it may still be streaming
+    # in, or be stepped through in an order a rebuild would not keep.
+
+    def __init__(self, budget=RASTER_BUDGET):
+        self.budget = budget
+        self.shapes = []
+        # Rasters saved with a loaded scene (scene_file.StoredRasters) are
+        # used before rasterizing again.
+        self.stored = None
+        self._rasters = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self.shapes)
+
+    @property
+    def raster_bytes(self):
+        return self._bytes
+
+    def append(self, shape, raster=None):
+        self.shapes.append(shape)
+        index = len(self.shapes) - 1
+        if raster is None:
+            self._evict()
+        else:
+            self.set_raster(index, raster)
+        return index
+
+    def replace(self, index, shape, raster=None):
+        self.shapes[index] = shape
+        self.forget(index)
+        if self.stored is not None:
+            self.stored.discard(index)
+        if raster is not None:
+            self.set_raster(index, raster)
+
+    def raster(self, index):
+        raster = self.lookup(index)
+        if raster is None:
+            raster = self.shapes[index].rasterize()
+            self.set_raster(index, raster)
+        return raster
+
+    def lookup(self, index):
+        # Like raster(), but returns None where the shape would have to be
+        # rasterized again.
+        raster = self._rasters.get(index)
+        if raster is not None:
+            self._rasters.move_to_end(index)
+            return raster
+
+        if self.stored is not None:
+            raster = self.stored.get(index)
+            if raster is not None:
+                self.set_raster(index, raster)
+        return raster
+
+    def cached(self, index):
+        return self._rasters.get(index)
+
+    def set_raster(self, index, raster):
+        self.forget(index)
+        self._rasters[index] = raster
+        self._bytes += raster.nbytes
+        self._evict()
+
+    def forget(self, index):
+        raster = self._rasters.pop(index, None)
+        if raster is not None:
+            self._bytes -= raster.nbytes
+
+    def _evict(self):
+        if self._bytes <= self.budget:
+            return
+        newest = len(self.shapes) - 1
+        for index in list(self._rasters):
+            if index != newest:
+                self.forget(index)
+                if self._bytes <= self.budget:
+                    return
+
+    def detach_stored(self):
+        # Copies the memoized rasters that are views of the stored file into
+        # memory, then lets go of the file.
+        if self.stored is None:
+            return
+        for index, raster in self._rasters.items():
+            if self.stored.owns(raster):
+                self._rasters[index] = raster.copy()
+        self.stored = None
+
+    def clear(self):
+        self.shapes.clear()
+        self.stored = None
+        self._rasters.clear()
+        self._bytes = 0
@@ -0,0 +1,177 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from algorithms.spans import SPAN_DTYPE
+from scene.scene import RASTER_BUDGET, Scene
+from scene.shapes import shape_from_spec
+
+# Layout: header | span blocks | raster index | descriptor table. The tables
+# come last so a save can stream each shape's spans out as it goes. Span
+# blocks start on ALIGNMENT boundaries and hold packed SPAN_DTYPE records.
+MAGIC = b"GESCENE\0"
+VERSION = 1
+ALIGNMENT = 64
+HEADER = struct.Struct("<8sIIQQQ")
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("count", "<i8")])
+
+
+class StoredRasters:
+    # Span arrays saved alongside a scene. The file is memory-mapped, so a
+    # shape's spans are only read from disk when they are first touched.
+
+    def __init__(self, path, index):
+        self.path = path
+        self._data = np.memmap(path, np.uint8, "r")
+        self._index = index
+
+    def owns(self, raster):
+        return np.may_share_memory(raster, self._data)
+
+    def get(self, index):
+        if index >= len(self._index):
+            return None
+        offset, count = self._index[index].tolist()
+        if count < 0:
+            return None
+        return self._data[offset : offset + count * SPAN_DTYPE.itemsize].view(
+            SPAN_DTYPE
+        )
+
+    def discard(self, index):
+        if index < len(self._index):
+            self._index[index]["count"] = -1
+
+
+def _pad(file):
+    padding = -file.tell() % ALIGNMENT
+    file.write(b"\0" * padding)
+
+
+def _write_temp(path, items):
+    # Streams (shape, spans) pairs out in order, spans None for a shape
+    # saved without them; only the descriptors and the index are held until
+    # the end. Written to a temporary file first: the scene being saved may
+    # itself be paging its spans in from `path`.
+    specs = []
+    index = []
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, "wb") as file:
+        file.write(b"\0" * HEADER.size)
+
+        for shape, spans in items:
+            specs.append(shape.spec())
+            if spans is None:
+                index.append((0, -1))
+                continue
+            spans = np.ascontiguousarray(spans, SPAN_DTYPE)
+            _pad(file)
+            index.append((file.tell(), len(spans)))
+            spans.tofile(file)
+
+        _pad(file)
+        index_offset = file.tell()
+        index = np.array(index, INDEX_DTYPE)
+        index.tofile(file)
+
+        table = json.dumps(specs).encode("utf-8")
+        table_offset = file.tell()
+        file.write(table)
+
+        file.seek(0)
+        file.write(
+            HEADER.pack(
+                MAGIC, VERSION, len(specs), index_offset, table_offset, len(table)
+            )
+        )
+
+    return temp_path, index
+
+
+def write_scene(path, items):
+    temp_path, _ = _write_temp(path, items)
+    os.replace(temp_path, path)
+
+
+def save_scene(path, scene, rasters=True):
+    items = (
+        (shape, scene.raster(index) if rasters else None)
+        for index, shape in enumerate(scene.shapes)
+    )
+    temp_path, index = _write_temp(path, items)
+
+    stored = scene.stored
+    if not (
+        stored is not None
+        and os.path.exists(path)
+        and os.path.samefile(stored.path, path)
+    ):
+        os.replace(temp_path, path)
+        return
+
+    # Saving over the file the scene pages from. A mapped file cannot be
+    # replaced on Windows, so the rasters still in use are copied out and the
+    # map closed first; the scene then pages from the new file.
+    scene.detach_stored()
+    os.replace(temp_path, path)
+    if rasters:
+        scene.stored = StoredRasters(path, index)
+
+
+def _spans_fit(index, end):
+    # Whether every stored span block lies between the header and `end`.
+    stored = index[index["count"] >= 0]
+    offsets = stored["offset"]
+    if np.any(offsets < HEADER.size) or np.any(offsets > end):
+        return False
+    room = (end - offsets) // SPAN_DTYPE.itemsize
+    return not np.any(stored["count"].astype(np.uint64) > room)
+
+
+def load_scene(path, budget=RASTER_BUDGET):
+    # Raises ValueError for anything that is not a whole scene file, rather
+    # than mapping whatever the offsets in a damaged one point at.
+    not_a_scene = ValueError(f"{path} is not a scene file")
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise not_a_scene
+
+        magic, version, count, index_offset, table_offset, table_size = HEADER.unpack(
+            header
+        )
+        if magic != MAGIC:
+            raise not_a_scene
+        if version > VERSION:
+            raise ValueError(f"{path} needs a newer version (format {version})")
+
+        size = os.fstat(file.fileno()).st_size
+        index_end = index_offset + count * INDEX_DTYPE.itemsize
+        if not (
+            HEADER.size <= index_offset
+            and index_end <= table_offset
+            and table_offset + table_size <= size
+        ):
+            raise not_a_scene
+
+        file.seek(table_offset)
+        try:
+            specs = json.loads(file.read(table_size).decode("utf-8"))
+            shapes = [shape_from_spec(spec) for spec in specs]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise not_a_scene from None
+        if len(shapes) != count:
+            raise not_a_scene
+
+    index = np.fromfile(path, INDEX_DTYPE, count, offset=index_offset)
+    if not _spans_fit(index, index_offset):
+        raise not_a_scene
+
+    scene = Scene(budget)
+    scene.shapes = shapes
+    if np.any(index["count"] >= 0):
+        scene.stored = StoredRasters(path, index)
+    return scene
@@ -0,0 +1,273 @@
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from algorithms.conics import (
+    cached_conic,
+    cached_conic_array,
+    hyperbola_branches,
+    midpoint_hyperbola,
+    midpoint_parabola,
+    parabola_branches,
+)
+from algorithms.nurbs import bezier_n_curve, nurbs_curve
+from algorithms.parametric_curves import bezier_curve, bspline_curve, hermite_curve
+from algorithms.spans import SPAN_DTYPE, pixel_array, span_array
+from algorithms.straight_lines import (
+    bresenham_int_line,
+    bresenham_line_spans,
+    dda_line,
+    wu_line,
+)
+
+
+def _box(xs, ys, margin=1):
+    return (
+        math.floor(min(xs)) - margin,
+        math.floor(min(ys)) - margin,
+        math.ceil(max(xs)) + margin,
+        math.ceil(max(ys)) + margin,
+    )
+
+
+def _intersection(a, b):
+    box = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    return box if box[0] <= box[2] and box[1] <= box[3] else None
+
+
+def _deferred(function, *args, **kwargs):
+    # Yields function(...) as one block once it is first asked for, which
+    # may well be on a RasterJob's pool thread.
+    yield function(*args, **kwargs)
+
+
+class Shape(ABC):
+    # What a tool drew, as the algorithm name, the clicked points and the
+    # settings it used. A few hundred bytes at most; the cells themselves
+    # are rebuilt from this whenever they are needed.
+
+    __slots__ = ("algorithm", "points", "params")
+    tool = None
+
+    def __init__(self, algorithm, points, **params):
+        self.algorithm = algorithm
+        self.points = [(p[0], p[1]) for p in points]
+        self.params = params
+
+    @abstractmethod
+    def generator(self, stepping=False, viewport=None):
+        # (generator, spans), or (None, False) if the points do not make a
+        # shape. With `stepping` it yields single cells in drawing order;
+        # otherwise spans may also come already packed into SPAN_DTYPE arrays.
+        # Cells outside `viewport` may be left out.
+        pass
+
+    def branches(self):
+        # ConicBranches for shapes that keep growing as the view moves.
+        return None
+
+    @abstractmethod
+    def bounds(self):
+        # (x_min, y_min, x_max, y_max) that every cell falls inside, or None.
+        pass
+
+    def rasterize(self):
+        generator, spans = self.generator()
+        if generator is None:
+            return np.empty(0, SPAN_DTYPE)
+        return span_array(generator) if spans else pixel_array(generator)
+
+    def spec(self):
+        return {
+            "tool": self.tool,
+            "algorithm": self.algorithm,
+            "points": [list(p) for p in self.points],
+            "params": dict(self.params),
+        }
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.algorithm!r}, {self.points!r})"
+
+
+class LineShape(Shape):
+    __slots__ = ()
+    tool = "line"
+
+    def generator(self, stepping=False, viewport=None):
+        (x1, y1), (x2, y2) = self.points[:2]
+        clip = self.params.get("clip")
+        if viewport is not None:
+            clip = viewport if clip is None else _intersection(clip, viewport)
+            if clip is None:
+                return None, False
+
+        spans = self.algorithm == "bresenham" and not stepping
+        if self.algorithm == "dda":
+            return dda_line(x1, y1, x2, y2, clip=clip), False
+        if spans:
+            return bresenham_line_spans(x1, y1, x2, y2, clip=clip), True
+        if self.algorithm == "bresenham":
+            return bresenham_int_line(x1, y1, x2, y2, clip=clip), False
+        if self.algorithm == "wu":
+            return wu_line(x1, y1, x2, y2, clip=clip), False
+        return None, False
+
+    def bounds(self):
+        (x1, y1), (x2, y2) = self.points[:2]
+        box = _box((x1, x2), (y1, y2))
+        clip = self.params.get("clip")
+        return box if clip is None else _intersection(box, clip)
+
+
+class ConicShape(Shape):
+    # P1 is the centre (the vertex for parabolas); P2 sets the size. With
+    # the "grow" param, hyperbolas and parabolas extend as far as "bounds",
+    # which the canvas widens as the view moves.
+
+    __slots__ = ()
+    tool = "conics"
+
+    def _size(self):
+        (x1, y1), (x2, y2) = self.points[:2]
+        if self.algorithm == "circle":
+            return (math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2),)
+        if self.algorithm == "parabola":
+            return max(1, abs(x2 - x1)), 1 if x2 - x1 > 0 else -1
+        a, b = abs(x2 - x1), abs(y2 - y1)
+        return (a, b) if a > 0 and b > 0 else None
+
+    def _growing(self):
+        return self.params.get("grow") and self.algorithm in ("hyperbola", "parabola")
+
+    def generator(self, stepping=False, viewport=None):
+        size = self._size()
+        if size is None:
+            return None, False
+        cx, cy = self.points[0]
+
+        if self.algorithm in ("circle", "ellipse"):
+            if stepping:
+                generator = cached_conic(self.algorithm, cx, cy, *size, bounds=viewport)
+                return generator, False
+            generator = _deferred(
+                cached_conic_array, self.algorithm, cx, cy, *size, bounds=viewport
+            )
+            return generator, True
+
+        bounds = None
+        if self._growing():
+            bounds = self.params.get("bounds") if viewport is None else viewport
+        if self.algorithm == "hyperbola":
+            return midpoint_hyperbola(cx, cy, *size, bounds=bounds), False
+        if self.algorithm == "parabola":
+            return midpoint_parabola(cx, cy, *size, bounds=bounds), False
+        return None, False
+
+    def rasterize(self):
+        size = self._size()
+        if size is None or self.algorithm not in ("circle", "ellipse"):
+            return super().rasterize()
+        cx, cy = self.points[0]
+        return cached_conic_array(self.algorithm, cx, cy, *size)
+
+    def branches(self):
+        size = self._size()
+        if size is None or not self._growing():
+            return None
+        cx, cy = self.points[0]
+        if self.algorithm == "hyperbola":
+            return hyperbola_branches(cx, cy, *size)
+        return parabola_branches(cx, cy, *size)
+
+    def bounds(self):
+        size = self._size()
+        if size is None:
+            return None
+        cx, cy = self.points[0]
+
+        if self.algorithm in ("circle", "ellipse"):
+            # The midpoint ellipse can overshoot its axes by a cell.
+            a = max(1, round(size[0])) + 1
+            b = max(1, round(size[-1])) + 1
+            return cx - a, cy - b, cx + a, cy + b
+
+        growing = self._growing()
+        if growing and self.params.get("bounds") is None:
+            return None
+
+        if self.algorithm == "hyperbola":
+            a, b = (max(1, round(v)) for v in size)
+            if growing:
+                x_min, y_min, x_max, y_max = self.params["bounds"]
+                reach_x = max(x_max - cx, cx - x_min)
+                reach_y = max(y_max - cy, cy - y_min)
+            else:
+                reach_y = max(50, 5 * b)
+                reach_x = math.ceil(a * math.sqrt(1 + (reach_y / b) ** 2)) + 1
+            return cx - reach_x, cy - reach_y, cx + reach_x, cy + reach_y
+
+        p, direction = max(1, round(size[0])), size[1]
+        if growing:
+            x_min, y_min, x_max, y_max = self.params["bounds"]
+            reach_x = x_max - cx if direction > 0 else cx - x_min
+            reach_y = max(y_max - cy, cy - y_min)
+        else:
+            reach_x = max(50, 5 * p)
+            reach_y = math.ceil(math.sqrt(4 * p * (reach_x + 1))) + 1
+        if direction > 0:
+            return cx, cy - reach_y, cx + reach_x, cy + reach_y
+        return cx - reach_x, cy - reach_y, cx, cy + reach_y
+
+
+class CurveShape(Shape):
+    # Params are the keyword arguments of the matching algorithms/ curve
+    # function: steps, connected, and tolerance/max_chord or degree/weights.
+
+    __slots__ = ()
+    tool = "curves"
+
+    _MIN_POINTS = {"hermite": 4, "bezier": 4, "bspline": 4, "bezier_n": 2, "nurbs": 2}
+
+    def generator(self, stepping=False, viewport=None):
+        points = self.points
+        if len(points) < self._MIN_POINTS.get(self.algorithm, math.inf):
+            return None, False
+
+        params = self.params
+        if viewport is not None:
+            params = dict(params, bounds=viewport)
+        if self.algorithm == "hermite":
+            return hermite_curve(*points[:4], **params), False
+        if self.algorithm == "bezier":
+            return bezier_curve(*points[:4], **params), False
+        if self.algorithm == "bspline":
+            return bspline_curve(points, **params), False
+        if self.algorithm == "bezier_n":
+            return bezier_n_curve(points, **params), False
+        return nurbs_curve(points, **params), False
+
+    def bounds(self):
+        points = self.points
+        if len(points) < self._MIN_POINTS.get(self.algorithm, math.inf):
+            return None
+
+        if self.algorithm == "hermite":
+            # The same curve as a Bezier, whose control points enclose it.
+            (x0, y0), (x1, y1), (mx0, my0), (mx1, my1) = points[:4]
+            points = [(x0, y0), (x0 + mx0 / 3, y0 + my0 / 3)]
+            points += [(x1 - mx1 / 3, y1 - my1 / 3), (x1, y1)]
+        elif self.algorithm == "bezier":
+            points = points[:4]
+        xs, ys = zip(*points)
+        return _box(xs, ys)
+
+
+SHAPE_TYPES = {cls.tool: cls for cls in (LineShape, ConicShape, CurveShape)}
+
+
+def shape_from_spec(spec):
+    shape_type = SHAPE_TYPES.get(spec.get("tool"))
+    if shape_type is None:
+        raise ValueError(f"Unknown tool: {spec.get('tool')!r}")
+    return shape_type(spec["algorithm"], spec["points"], **spec.get("params", {}))
@@ -1,37 +1,130 @@
-from PyQt6.QtCore import QPoint, Qt, pyqtSignal
-from PyQt6.QtGui import QColor, QPainter, QPen
+from functools import partial
+
+import numpy as np
+from PyQt6.QtCore import (
+    QLine,
+    QPoint,
+    QPointF,
+    QRect,
+    QRectF,
+    Qt,
+    QThreadPool,
+    QTimer,
+    pyqtSignal,
+)
+from PyQt6.QtGui import QBrush, QColor, QImage, QPainter, QPen, QPixmap, QRegion
 from PyQt6.QtWidgets import QWidget
 
+from algorithms.spans import SPAN_DTYPE, pixel_array, span_array, span_cells
+from scene.scene import Scene
+from ui.raster_layer import RasterLayer, argb_pixels, tile_bounds
+from ui.raster_worker import RasterJob
+from ui.spatial_index import GridIndex, span_bounds, union_bounds
+
+# At or below LOD_CELL_SIZE the grid is hidden and shapes are drawn as one
+# downsampled image; the grid fades out on the way down from GRID_FADE_SIZE.
+LOD_CELL_SIZE = 4
+GRID_FADE_SIZE = 8
+# Cell sizes the zoom levels step through: halves of a pixel below one,
+# whole sizes two apart above it.
+CELL_SIZES = (1 / 16, 1 / 8, 1 / 4, 1 / 2, *range(1, 152, 2))
+DEFAULT_ZOOM = CELL_SIZES.index(25)
+
+
+def _extended(branches, bounds):
+    yield from branches.extend(bounds)
+
+
+def _in_viewport(spans, viewport):
+    x_min, y_min, x_max, y_max = viewport
+    keep = (
+        (spans["y"] >= y_min)
+        & (spans["y"] <= y_max)
+        & (spans["x_start"] <= x_max)
+        & (spans["x_end"] >= x_min)
+    )
+    return spans[keep]
+
 
 class CanvasWidget(QWidget):
     point_selected = pyqtSignal(int, int)
     point_moved = pyqtSignal(int, int)
+    shape_changed = pyqtSignal()
+    points_changed = pyqtSignal()
+    viewport_changed = pyqtSignal()
 
     def __init__(self):
         super().__init__()
         self.setMinimumSize(600, 600)
         self.setMouseTracking(True)
+        # paintEvent fills everything it is asked to, which lets scroll()
+        # move the existing pixels instead of erasing them.
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
 
-        self.cell_size = 25
+        self.zoom_level = DEFAULT_ZOOM
         self.offset_x = 150.0
         self.offset_y = 150.0
 
         self.is_panning = False
         self.last_pan_pos = QPoint()
+        self.pan_delta = QPoint()
+        self.exposed_strips = []
+        self.pan_timer = QTimer(self)
+        self.pan_timer.setSingleShot(True)
+        self.pan_timer.setInterval(16)
+        self.pan_timer.timeout.connect(self._apply_pan)
         self.is_editing_point = False
         self.edited_point_idx = None
 
-        self.lines = []
+        # Shapes are kept as descriptors; their cells are rebuilt on demand.
+        self.scene = Scene()
         self.clicked_points = []
 
-        self.current_line_pixels = []
         self.current_step = 0
+        self.stepping = False
+
+        self.growing_shapes = []
+
+        # The newest shape may still be filling in from a background job;
+        # its chunks land in `job_buffer`, and its raster is a view of that.
+        self.job = None
+        self.running_jobs = set()
+        self.job_branches = None
+        self.job_buffer = None
+        self.job_size = 0
+        self.job_timer = QTimer(self)
+        self.job_timer.setSingleShot(True)
+        self.job_timer.setInterval(30)
+        self.job_timer.timeout.connect(self._show_progress)
+
+        # Live preview of the shape being placed. Only one preview job runs
+        # at a time; a request made meanwhile waits in `preview_request`
+        # and replaces any older one, and the running job's result is
+        # dropped.
+        self.preview = np.empty(0, SPAN_DTYPE)
+        self.preview_job = None
+        self.preview_request = None
 
         self.bg_color = QColor(255, 255, 255)
         self.grid_color = QColor(220, 220, 220)
         self.axis_color = QColor(0, 0, 0)
         self.pixel_color = QColor(0, 0, 0)
         self.point_color = QColor(3, 3, 3)
+        self.preview_color = QColor(33, 150, 243)
+
+        # Every shape but the newest is baked into this layer; the newest
+        # stays separate so debug stepping can show part of it.
+        self.committed = RasterLayer(self.pixel_color)
+        self.grid_tile = None
+        self.grid_tile_key = None
+        # Committed shapes are indexed by bounding box and only baked once
+        # they first come into view.
+        self.shape_index = GridIndex()
+        self.unstamped = set()
+        # Committed shapes with no raster at hand (evicted, or loaded without
+        # one) are rebuilt by background jobs, keyed by index, and only
+        # stamped once they land.
+        self.rebuild_jobs = {}
 
     def world_to_screen(self, world_x: float, world_y: float):
         h = self.height()
@@ -45,46 +138,429 @@ class CanvasWidget(QWidget):
         world_y = int((h - screen_y - self.offset_y) // self.cell_size)
         return world_x, world_y
 
+    def get_viewport(self, rect=None):
+        if rect is None:
+            rect = self.rect()
+        x_min, y_max = self.screen_to_world(rect.left(), rect.top())
+        x_max, y_min = self.screen_to_world(rect.right() + 1, rect.bottom() + 1)
+        return x_min, y_min, x_max, y_max
+
+    @property
+    def cell_size(self):
+        return CELL_SIZES[self.zoom_level]
+
     def zoom_in(self):
-        if self.cell_size < 150:
-            self.cell_size += 2
-            self.update()
+        if self.zoom_level == len(CELL_SIZES) - 1:
+            return
+        self.zoom_level += 1
+        self.update()
+        self.viewport_changed.emit()
 
     def zoom_out(self):
-        if self.cell_size > 2:
-            self.cell_size -= 2
-            self.update()
+        if self.zoom_level == 0:
+            return
+        self.zoom_level -= 1
+        self._grow_shapes()
+        self.update()
+        self.viewport_changed.emit()
 
     def reset_view(self):
         self.offset_x = 150.0
         self.offset_y = 150.0
-        self.cell_size = 25
+        self.zoom_level = DEFAULT_ZOOM
+        self._grow_shapes()
         self.update()
+        self.viewport_changed.emit()
 
     def clear_all(self):
-        self.lines.clear()
+        self.cancel_job()
+        self._cancel_rebuilds()
+        self.growing_shapes.clear()
+        self.committed.clear()
+        self.shape_index.clear()
+        self.unstamped.clear()
+        self.scene.clear()
         self.clicked_points.clear()
-        self.current_line_pixels.clear()
         self.current_step = 0
+        self.clear_preview()
         self.update()
 
+    def set_scene(self, scene):
+        # Loaded shapes are only indexed here; their cells are paged in or
+        # rebuilt once they come into view. Growing conics are rebuilt right
+        # away so that their branches are ready to grow again.
+        self.clear_all()
+        self.scene = scene
+        viewport = self.get_viewport()
+        for index, shape in enumerate(scene.shapes):
+            if shape.branches() is not None:
+                shape.params.setdefault("bounds", viewport)
+                self._rebuild(index)
+            if index < len(scene) - 1:
+                self._commit_shape(index)
+        if scene and scene.lookup(len(scene) - 1) is None:
+            self._rebuild(len(scene) - 1)
+        self.stepping = False
+        self.current_step = len(self.current_line_pixels)
+        self.update()
+        self.shape_changed.emit()
+
     def clear_clicked_points(self):
         self.clicked_points.clear()
         self.update()
+        self.points_changed.emit()
 
     def get_clicked_points(self):
         return self.clicked_points.copy()
 
-    def run_algorithm(self, generator):
-        self.current_line_pixels = list(generator)
-        self.current_step = len(self.current_line_pixels)
-        self.lines.append(self.current_line_pixels.copy())
+    @property
+    def current_line_pixels(self):
+        # The newest shape is drawn from the same array it is stored in. It
+        # is empty while a rebuild job is still on its way.
+        raster = None
+        if self.scene:
+            raster = self.scene.lookup(len(self.scene) - 1)
+        return np.empty(0, SPAN_DTYPE) if raster is None else raster
+
+    def add_shape(self, shape, stepping=False, generator=None):
+        # Starts drawing `shape` as the newest shape, or returns False if its
+        # points do not make one. `generator` stands in for the shape's own
+        # when the caller already has the cells at hand. The shape starts
+        # empty and fills in as a RasterJob streams it; with `stepping`,
+        # current_step is left for the debug slider to move.
+        spans = False
+        branches = shape.branches()
+        if branches is not None:
+            # Growth on pan and zoom only starts once the first pass has
+            # finished.
+            viewport = self.get_viewport()
+            shape.params["bounds"] = viewport
+            generator = _extended(branches, viewport)
+        elif generator is None:
+            generator, spans = shape.generator(stepping)
+        if generator is None:
+            return False
+
+        self.cancel_job()
+        self.clear_preview()
+        if self.scene:
+            self._commit_shape(len(self.scene) - 1)
+        self.scene.append(shape, np.empty(0, SPAN_DTYPE))
+        self.current_step = 0
+        self.stepping = stepping
+
+        job = RasterJob(generator, spans)
+        job.signals.chunk_ready.connect(partial(self._append_chunk, job))
+        job.signals.finished.connect(partial(self._finish_job, job))
+        self.job = job
+        self.running_jobs.add(job)
+        self.job_branches = branches
+        self.job_buffer = np.empty(RasterJob.CHUNK_SIZE, SPAN_DTYPE)
+        self.job_size = 0
+        job.start()
         self.update()
+        return True
 
-    def set_debug_step(self, step):
-        self.current_step = max(0, min(step, len(self.current_line_pixels)))
+    def cancel_job(self):
+        # The partial raster is dropped: the shape is about to be replaced,
+        # or finished right away, or committed and rebuilt in the background
+        # once it comes into view.
+        if self.job is None:
+            return
+
+        self.job.cancel()
+        self.job = None
+        self.job_branches = None
+        self.job_buffer = None
+        self.scene.forget(len(self.scene) - 1)
+        self.job_timer.stop()
+
+    def stop_jobs(self):
+        # Cancels every background job and waits for their threads, so that
+        # none of them emits into signals that are already gone.
+        self.cancel_job()
+        self._cancel_rebuilds()
+        self.clear_preview()
+        QThreadPool.globalInstance().waitForDone()
+
+    def finish_job(self):
+        # Save and export block until they are done anyway, so rather than
+        # wait for a streaming shape this rasterizes it in full right away.
+        if self.job is None:
+            return
+
+        index = len(self.scene) - 1
+        self.cancel_job()
+        generator, spans, branches = self._raster_source(index, self.stepping)
+        raster = span_array(generator) if spans else pixel_array(generator)
+        self.scene.set_raster(index, raster)
+        if branches is not None:
+            self.growing_shapes.append((index, branches))
+        self._show_progress()
+
+    def _append_chunk(self, job, chunk):
+        if job is not self.job:
+            return
+
+        size = self.job_size + len(chunk)
+        if size > len(self.job_buffer):
+            grown = np.empty(max(size, 2 * len(self.job_buffer)), SPAN_DTYPE)
+            grown[: self.job_size] = self.job_buffer[: self.job_size]
+            self.job_buffer = grown
+        self.job_buffer[self.job_size : size] = chunk
+        self.job_size = size
+        self.scene.set_raster(len(self.scene) - 1, self.job_buffer[:size])
+
+        if not self.job_timer.isActive():
+            self.job_timer.start()
+
+    def _finish_job(self, job):
+        # Cancelled jobs are kept referenced until their thread lets go.
+        self.running_jobs.discard(job)
+        if job is not self.job:
+            return
+
+        self.job = None
+        index = len(self.scene) - 1
+        self.scene.set_raster(index, self.job_buffer[: self.job_size].copy())
+        self.job_buffer = None
+        if self.job_branches is not None:
+            self.growing_shapes.append((index, self.job_branches))
+            self.job_branches = None
+        self.job_timer.stop()
+        self._show_progress()
+
+    def _raster_source(self, index, stepping=False):
+        # (generator, spans, branches) that rebuild shape `index` in full.
+        # Growing conics come with fresh branches extended to their bounds.
+        shape = self.scene.shapes[index]
+        branches = shape.branches()
+        if branches is not None:
+            return _extended(branches, shape.params["bounds"]), False, branches
+        generator, spans = shape.generator(stepping)
+        if generator is None:
+            return iter(()), False, None
+        return generator, spans, None
+
+    def _rebuild(self, index):
+        if index in self.rebuild_jobs:
+            return
+
+        generator, spans, branches = self._raster_source(index)
+        bounds = self.scene.shapes[index].params.get("bounds")
+        chunks = []
+        job = RasterJob(generator, spans)
+        job.signals.chunk_ready.connect(chunks.append)
+        job.signals.finished.connect(
+            partial(self._finish_rebuild, job, index, chunks, branches, bounds)
+        )
+        self.rebuild_jobs[index] = job
+        self.running_jobs.add(job)
+        job.start()
+
+    def _cancel_rebuilds(self, index=None):
+        indices = list(self.rebuild_jobs) if index is None else [index]
+        for index in indices:
+            job = self.rebuild_jobs.pop(index, None)
+            if job is not None:
+                job.cancel()
+
+    def _finish_rebuild(self, job, index, chunks, branches, bounds):
+        self.running_jobs.discard(job)
+        if self.rebuild_jobs.get(index) is not job:
+            return
+
+        del self.rebuild_jobs[index]
+        if self.scene.shapes[index].params.get("bounds") != bounds:
+            # A growing conic widened meanwhile; its new cells are not in
+            # these chunks.
+            self._rebuild(index)
+            return
+
+        raster = np.concatenate(chunks) if chunks else np.empty(0, SPAN_DTYPE)
+        self.scene.set_raster(index, raster)
+        if branches is not None and index not in dict(self.growing_shapes):
+            self.growing_shapes.append((index, branches))
+
+        if index == len(self.scene) - 1:
+            self._show_progress()
+            return
+        if index in self.unstamped:
+            self.committed.stamp_spans(raster)
+            self.unstamped.discard(index)
+        # An evicted tile may be waiting on it too.
         self.update()
 
+    def _show_progress(self):
+        if not self.stepping:
+            self.current_step = len(self.current_line_pixels)
+        self.update()
+        self.shape_changed.emit()
+
+    def run_preview(self, generator, spans=False):
+        self.preview_request = (generator, spans)
+        if self.preview_job is None:
+            self._start_preview()
+        else:
+            self.preview_job.cancel()
+
+    def clear_preview(self):
+        self.preview_request = None
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+        if len(self.preview):
+            self.preview = np.empty(0, SPAN_DTYPE)
+            self.update()
+
+    def _start_preview(self):
+        generator, spans = self.preview_request
+        self.preview_request = None
+
+        chunks = []
+        job = RasterJob(generator, spans)
+        job.signals.chunk_ready.connect(chunks.append)
+        job.signals.finished.connect(partial(self._finish_preview, job, chunks))
+        self.preview_job = job
+        job.start()
+
+    def _finish_preview(self, job, chunks):
+        self.preview_job = None
+        if self.preview_request is not None:
+            self._start_preview()
+            return
+        if job.cancelled():
+            return
+
+        # Anything outside the viewport is dropped so drawing stays bounded.
+        spans = np.concatenate(chunks) if chunks else np.empty(0, SPAN_DTYPE)
+        self.preview = _in_viewport(spans, self.get_viewport())
+        self.update()
+
+    def replace_shape(self, index, shape, raster):
+        self._cancel_rebuilds(index)
+        if index == len(self.scene) - 1:
+            at_end = self.current_step == len(self.current_line_pixels)
+            self.cancel_job()
+            self.scene.replace(index, shape, raster)
+            if at_end:
+                self.current_step = len(raster)
+            else:
+                self.current_step = min(self.current_step, len(raster))
+        else:
+            self.scene.replace(index, shape, raster)
+            self.shape_index.insert(index, span_bounds(raster))
+            self.committed.clear()
+            self.unstamped = set(range(len(self.scene) - 1))
+        self.update()
+
+    def splice_shape(self, index, shape, start, stop, spans):
+        # Like replace_shape, for an edit that only changed the spans in
+        # [start, stop) of the shape's raster.
+        raster = self.scene.lookup(index)
+        raster = np.concatenate([raster[:start], spans, raster[stop:]])
+        self.replace_shape(index, shape, raster)
+
+    def _commit_shape(self, index):
+        # Exact bounds while the cells are at hand, the descriptor's
+        # estimate otherwise.
+        raster = self.scene.cached(index)
+        if raster is None:
+            bounds = self.scene.shapes[index].bounds()
+        else:
+            bounds = span_bounds(raster)
+        self.shape_index.insert(index, bounds)
+        self.unstamped.add(index)
+
+    def _restore_tiles(self, viewport):
+        # Evicted tiles come back once every stamped shape on them has its
+        # raster at hand; until then rebuild jobs fetch the missing ones.
+        keys = self.committed.evicted_keys(viewport)
+        if not keys:
+            return
+        rect = None
+        for key in keys:
+            rect = union_bounds(rect, tile_bounds(key))
+
+        rasters = []
+        missing = False
+        for index in sorted(self.shape_index.query(rect) - self.unstamped):
+            raster = self.scene.lookup(index)
+            if raster is None:
+                self._rebuild(index)
+                missing = True
+            else:
+                rasters.append(_in_viewport(raster, rect))
+        if not missing:
+            spans = np.concatenate(rasters) if rasters else np.empty(0, SPAN_DTYPE)
+            self.committed.restore(keys, spans)
+
+    def _stamp_visible(self, viewport):
+        # Shapes with no raster at hand are left for a rebuild job to stamp.
+        self.committed.trim(viewport)
+        self._restore_tiles(viewport)
+        if not self.unstamped:
+            return
+        rasters = []
+        for index in sorted(self.shape_index.query(viewport, self.unstamped)):
+            raster = self.scene.lookup(index)
+            if raster is None:
+                self._rebuild(index)
+            else:
+                rasters.append(raster)
+                self.unstamped.discard(index)
+        if rasters:
+            self.committed.stamp_spans(np.concatenate(rasters))
+
+    def _grow_shapes(self):
+        grown = False
+        viewport = self.get_viewport()
+        for index, branches in self.growing_shapes:
+            spans = pixel_array(branches.extend(viewport))
+            if len(spans) == 0:
+                continue
+
+            grown = True
+            shape = self.scene.shapes[index]
+            shape.params["bounds"] = union_bounds(shape.params["bounds"], viewport)
+
+            # An evicted raster is rebuilt from the widened bounds instead.
+            raster = self.scene.cached(index)
+            if raster is not None:
+                self.scene.set_raster(index, np.concatenate([raster, spans]))
+
+            if index == len(self.scene) - 1:
+                if raster is not None and self.current_step == len(raster):
+                    self.current_step += len(spans)
+            else:
+                bounds = union_bounds(
+                    self.shape_index.bounds(index), span_bounds(spans)
+                )
+                self.shape_index.insert(index, bounds)
+                if index not in self.unstamped:
+                    self.committed.stamp_spans(spans)
+        return grown
+
+    def set_debug_step(self, step):
+        # Only the cells that appear or disappear are repainted; everything
+        # else under them comes from the cached grid and raster layers.
+        step = max(0, min(step, len(self.current_line_pixels)))
+        first, last = sorted((self.current_step, step))
+        self.current_step = step
+        if first < last:
+            self.update(self._spans_rect(self.current_line_pixels[first:last]))
+
+    def _spans_rect(self, spans):
+        left, top = self.world_to_screen(
+            int(spans["x_start"].min()), int(spans["y"].max()) + 1
+        )
+        right, bottom = self.world_to_screen(
+            int(spans["x_end"].max()) + 1, int(spans["y"].min())
+        )
+        # One pixel of slack for the int() truncation in _draw_span.
+        return QRect(
+            int(left) - 1, int(top) - 1, int(right - left) + 3, int(bottom - top) + 3
+        )
+
     def get_max_steps(self):
         return len(self.current_line_pixels)
 
@@ -102,6 +578,7 @@ class CanvasWidget(QWidget):
             wx, wy = self.screen_to_world(a0.pos().x(), a0.pos().y())
             self.clicked_points.append((wx, wy))
             self.update()
+            self.points_changed.emit()
         elif a0.button() == Qt.MouseButton.MiddleButton:
             wx, wy = self.screen_to_world(a0.pos().x(), a0.pos().y())
             for i, point in enumerate(self.clicked_points):
@@ -113,6 +590,9 @@ class CanvasWidget(QWidget):
         elif a0.button() == Qt.MouseButton.LeftButton:
             self.is_panning = True
             self.last_pan_pos = a0.pos()
+            screen = self.screen()
+            if screen is not None and screen.refreshRate() > 0:
+                self.pan_timer.setInterval(max(1, round(1000 / screen.refreshRate())))
             self.setCursor(Qt.CursorShape.ClosedHandCursor)
 
     def mouseMoveEvent(self, a0):
@@ -126,12 +606,37 @@ class CanvasWidget(QWidget):
                 self.clicked_points[self.edited_point_idx] = (wx, wy)
                 self.point_moved.emit(a0.pos().x(), a0.pos().y())
                 self.update()
+                self.points_changed.emit()
         elif self.is_panning and a0 is not None:
-            delta = a0.pos() - self.last_pan_pos
-            self.offset_x += delta.x()
-            self.offset_y -= delta.y()
+            # Moves are summed and applied at most once per frame.
+            self.pan_delta += a0.pos() - self.last_pan_pos
             self.last_pan_pos = a0.pos()
+            if not self.pan_timer.isActive():
+                self.pan_timer.start()
+
+    def _apply_pan(self):
+        dx, dy = self.pan_delta.x(), self.pan_delta.y()
+        self.pan_delta = QPoint()
+        if dx == 0 and dy == 0:
+            return
+
+        self.offset_x += dx
+        self.offset_y -= dy
+        self.viewport_changed.emit()
+        if self._grow_shapes():
             self.update()
+            return
+
+        w, h = self.width(), self.height()
+        if dx > 0:
+            self.exposed_strips.append(QRect(0, 0, dx, h))
+        elif dx < 0:
+            self.exposed_strips.append(QRect(w + dx, 0, -dx, h))
+        if dy > 0:
+            self.exposed_strips.append(QRect(0, 0, w, dy))
+        elif dy < 0:
+            self.exposed_strips.append(QRect(0, h + dy, w, -dy))
+        self.scroll(dx, dy)
 
     def mouseReleaseEvent(self, a0):
         if a0 is not None:
@@ -139,9 +644,29 @@ class CanvasWidget(QWidget):
                 self.is_editing_point = False
                 self.edited_point_idx = None
             elif a0.button() == Qt.MouseButton.LeftButton:
+                self.pan_timer.stop()
+                self._apply_pan()
                 self.is_panning = False
                 self.setCursor(Qt.CursorShape.ArrowCursor)
 
+    def resizeEvent(self, a0):
+        self._grow_shapes()
+        super().resizeEvent(a0)
+        self.viewport_changed.emit()
+
+    def _paint_rects(self, region):
+        # After a scroll only the exposed strips are dirty. Painting them one
+        # by one keeps a diagonal pan from redrawing their bounding box.
+        strips, self.exposed_strips = self.exposed_strips, []
+        if strips:
+            exposed = QRegion()
+            for strip in strips:
+                exposed = exposed.united(strip)
+            if region.subtracted(exposed).isEmpty():
+                rects = [strip.intersected(region.boundingRect()) for strip in strips]
+                return [rect for rect in rects if not rect.isEmpty()]
+        return [region.boundingRect()]
+
     def paintEvent(self, a0):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
@@ -149,74 +674,154 @@ class CanvasWidget(QWidget):
         w = self.width()
         h = self.height()
 
-        painter.fillRect(0, 0, w, h, self.bg_color)
+        region = a0.region() if a0 is not None else QRegion(self.rect())
+        for rect in self._paint_rects(region):
+            painter.setClipRect(rect)
+            viewport = self.get_viewport(rect)
 
-        self._draw_grid(painter, w, h)
-        self._draw_axes(painter, w, h)
-        self._draw_all_lines(painter)
-        self._draw_current_line(painter)
-        self._draw_clicked_points(painter)
+            painter.fillRect(rect, self.bg_color)
+
+            self._draw_grid(painter, w, h)
+            self._draw_axes(painter, w, h)
+            if self.cell_size <= LOD_CELL_SIZE:
+                self._draw_downsampled(painter, h, viewport)
+            else:
+                self._draw_all_lines(painter, viewport)
+                self._draw_current_line(painter, viewport)
+            self._draw_preview(painter, viewport)
+            self._draw_clicked_points(painter)
 
         painter.end()
 
+    def _grid_brush(self):
+        # One cell of the grid (its left and top edge), rebuilt only when the
+        # zoom or the device pixel ratio changes.
+        ratio = self.devicePixelRatioF()
+        key = (self.cell_size, ratio)
+        if self.grid_tile_key != key:
+            size = int(self.cell_size)
+            tile = QPixmap(round(size * ratio), round(size * ratio))
+            tile.setDevicePixelRatio(ratio)
+            tile.fill(Qt.GlobalColor.transparent)
+
+            color = QColor(self.grid_color)
+            fade = (self.cell_size - LOD_CELL_SIZE) / (GRID_FADE_SIZE - LOD_CELL_SIZE)
+            color.setAlphaF(min(1.0, fade))
+
+            painter = QPainter(tile)
+            painter.setPen(QPen(color, 1))
+            # Lines on the far edges too: at a pixel ratio above 1 half of a
+            # line's width falls on the previous cell.
+            for edge in (0, size):
+                painter.drawLines(
+                    [QLine(edge, 0, edge, size), QLine(0, edge, size, edge)]
+                )
+            painter.end()
+
+            self.grid_tile = QBrush(tile)
+            self.grid_tile_key = key
+        return self.grid_tile
+
     def _draw_grid(self, painter: QPainter, w: int, h: int):
-        pen = QPen(self.grid_color, 1)
-        painter.setPen(pen)
+        if self.cell_size <= LOD_CELL_SIZE:
+            return
 
         x_start = self.offset_x % self.cell_size
-        x = x_start
-        while x < w:
-            painter.drawLine(int(x), 0, int(x), h)
-            x += self.cell_size
-
         y_start = (h - self.offset_y) % self.cell_size
-        y = y_start
-        while y < h:
-            painter.drawLine(0, int(y), w, int(y))
-            y += self.cell_size
+        painter.setBrushOrigin(QPointF(int(x_start), int(y_start)))
+        painter.fillRect(0, 0, w, h, self._grid_brush())
 
     def _draw_axes(self, painter: QPainter, w: int, h: int):
         pen = QPen(self.axis_color, 2)
         painter.setPen(pen)
 
         ax_y = int(h - self.offset_y - self.cell_size // 2)
-        painter.drawLine(0, ax_y, w, ax_y)
-
         ax_x = int(self.offset_x + self.cell_size // 2)
-        painter.drawLine(ax_x, 0, ax_x, h)
-
-    def _draw_all_lines(self, painter: QPainter):
-        if len(self.lines) == 0:
-            return
-
-        for line_pixels in self.lines[:-1]:
-            for grid_x, grid_y, opacity in line_pixels:
-                self._draw_pixel(painter, grid_x, grid_y, opacity)
-
-    def _draw_current_line(self, painter: QPainter):
-        if len(self.current_line_pixels) == 0:
-            return
-
-        for i in range(min(self.current_step, len(self.current_line_pixels))):
-            grid_x, grid_y, opacity = self.current_line_pixels[i]
-            self._draw_pixel(painter, grid_x, grid_y, opacity)
-
-    def _draw_pixel(self, painter: QPainter, grid_x: int, grid_y: int, opacity: float):
-        sx, sy = self.world_to_screen(grid_x, grid_y)
+        painter.drawLines([QLine(0, ax_y, w, ax_y), QLine(ax_x, 0, ax_x, h)])
+
+    def _draw_all_lines(self, painter: QPainter, viewport):
+        self._stamp_visible(viewport)
+        self.committed.draw(
+            painter,
+            viewport,
+            self.offset_x,
+            self.offset_y,
+            self.cell_size,
+            self.height(),
+        )
+
+    def _visible_steps(self, viewport):
+        return _in_viewport(self.current_line_pixels[: self.current_step], viewport)
+
+    def _draw_current_line(self, painter: QPainter, viewport):
+        spans = self._visible_steps(viewport)
+        for grid_y, x_start, x_end, alpha in spans.tolist():
+            self._draw_span(painter, grid_y, x_start, x_end, alpha / 255)
+
+    def _draw_preview(self, painter: QPainter, viewport):
+        spans = _in_viewport(self.preview, viewport)
+        for grid_y, x_start, x_end, alpha in spans.tolist():
+            left, top = self.world_to_screen(x_start, grid_y + 1)
+            right, bottom = self.world_to_screen(x_end + 1, grid_y)
+            color = QColor(self.preview_color)
+            color.setAlphaF(0.6 * alpha / 255)
+            painter.fillRect(QRectF(left, top, right - left, bottom - top), color)
+
+    def _draw_downsampled(self, painter: QPainter, h: int, viewport):
+        self._stamp_visible(viewport)
+
+        # One image pixel per cell, or per factor x factor block of cells
+        # once cells are smaller than a screen pixel.
+        factor = max(1, round(1 / self.cell_size))
+        alpha = self.committed.pooled(viewport, factor)
+        rows, cols = alpha.shape
+        bx0, by1 = viewport[0] // factor, viewport[3] // factor
+
+        shape = self._visible_steps(viewport)
+        if len(shape):
+            x, y, opacity = span_cells(shape)
+            col = x // factor - bx0
+            row = by1 - y // factor
+            keep = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+            opacity = np.rint(opacity[keep] * 255).astype(np.uint8)
+            np.maximum.at(alpha, (row[keep], col[keep]), opacity)
+
+        pixels = argb_pixels(alpha, self.pixel_color)
+        image = QImage(
+            pixels.data, cols, rows, cols * 4, QImage.Format.Format_ARGB32_Premultiplied
+        )
+        size = factor * self.cell_size
+        target = QRectF(
+            self.offset_x + bx0 * size,
+            h - self.offset_y - (by1 + 1) * size,
+            cols * size,
+            rows * size,
+        )
+        painter.drawImage(target, image)
+
+    def _draw_span(
+        self,
+        painter: QPainter,
+        grid_y: int,
+        x_start: int,
+        x_end: int,
+        opacity: float,
+    ):
+        sx, sy = self.world_to_screen(x_start, grid_y)
         x = int(sx)
         y = int(sy - self.cell_size)
         size = int(self.cell_size)
 
         color = QColor(self.pixel_color)
         color.setAlphaF(opacity)
-        painter.fillRect(x, y, size, size, color)
+        painter.fillRect(x, y, size * (x_end - x_start + 1), size, color)
 
     def _draw_clicked_points(self, painter: QPainter):
         for grid_x, grid_y in self.clicked_points:
             sx, sy = self.world_to_screen(grid_x, grid_y)
             x = int(sx)
             y = int(sy - self.cell_size)
-            size = int(self.cell_size)
+            size = max(1, int(self.cell_size))
 
             color = QColor(self.point_color)
             color.setAlphaF(0.7)
@@ -1,19 +1,32 @@
+import os
+
 from PyQt6.QtCore import QSettings, Qt
+from PyQt6.QtGui import QKeySequence
 from PyQt6.QtWidgets import (
     QButtonGroup,
+    QFileDialog,
     QHBoxLayout,
+    QInputDialog,
     QLabel,
     QMainWindow,
+    QMessageBox,
+    QProgressDialog,
     QPushButton,
     QVBoxLayout,
     QWidget,
 )
 
+from scene.export import export_image
+from scene.scene_file import load_scene, save_scene
 from ui.canvas_widget import CanvasWidget
 from ui.tools.conic_tool import ConicsToolWidget
 from ui.tools.curves_tool import CurvesTool
 from ui.tools.line_tool import LineTool
 
+SCENE_EXTENSION = ".gescene"
+SCENE_FILTER = f"Scenes (*{SCENE_EXTENSION})"
+IMAGE_FILTER = "PNG (*.png);;PGM (*.pgm);;PBM (*.pbm)"
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -52,6 +65,22 @@ class MainWindow(QMainWindow):
         self._register_tools()
 
         self._activate_tool("line")
+        self._create_menu()
+
+    def _create_menu(self):
+        file_menu = self.menuBar().addMenu("File")
+
+        open_action = file_menu.addAction("Open Scene...")
+        open_action.setShortcut(QKeySequence.StandardKey.Open)
+        open_action.triggered.connect(self.on_open_scene)
+
+        save_action = file_menu.addAction("Save Scene...")
+        save_action.setShortcut(QKeySequence.StandardKey.Save)
+        save_action.triggered.connect(self.on_save_scene)
+
+        file_menu.addSeparator()
+        export_action = file_menu.addAction("Export Image...")
+        export_action.triggered.connect(self.on_export_image)
 
     def _create_tool_panel(self):
         panel = QWidget()
@@ -138,6 +167,80 @@ class MainWindow(QMainWindow):
             settings_widget = self.current_tool.get_settings_widget()
             self.settings_layout.addWidget(settings_widget)
 
+    def on_open_scene(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Open Scene", self.settings.value("scene_dir", ""), SCENE_FILTER
+        )
+        if not path:
+            return
+
+        try:
+            scene = load_scene(path)
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, "Open Scene", str(error))
+            return
+
+        self.settings.setValue("scene_dir", os.path.dirname(path))
+        self.current_tool.on_clear()
+        self.canvas.set_scene(scene)
+
+    def on_save_scene(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save Scene", self.settings.value("scene_dir", ""), SCENE_FILTER
+        )
+        if not path:
+            return
+        if not os.path.splitext(path)[1]:
+            path += SCENE_EXTENSION
+
+        self.canvas.finish_job()
+        try:
+            save_scene(path, self.canvas.scene)
+        except OSError as error:
+            QMessageBox.warning(self, "Save Scene", str(error))
+            return
+
+        self.settings.setValue("scene_dir", os.path.dirname(path))
+
+    def on_export_image(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Image", self.settings.value("scene_dir", ""), IMAGE_FILTER
+        )
+        if not path:
+            return
+        if not os.path.splitext(path)[1]:
+            path += ".png"
+
+        cell_px, ok = QInputDialog.getInt(
+            self, "Export Image", "Pixels per cell:", 4, 1, 64
+        )
+        if not ok:
+            return
+
+        # setValue on a modal progress dialog keeps the window responsive
+        # and lets Cancel through between rows.
+        progress = QProgressDialog("Exporting image...", "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
+
+        def report(done, total):
+            progress.setValue(done * 100 // total)
+
+        self.canvas.finish_job()
+        try:
+            export_image(
+                path,
+                self.canvas.scene,
+                cell_px=cell_px,
+                progress=report,
+                cancelled=progress.wasCanceled,
+            )
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, "Export Image", str(error))
+        finally:
+            progress.close()
+
     def closeEvent(self, a0):
+        self.canvas.stop_jobs()
         self.settings.setValue("geometry", self.saveGeometry())
         super().closeEvent(a0)
@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QImage, QPainter
+
+from algorithms.spans import span_cells
+
+TILE_SIZE = 256
+# Tiles beyond TILE_BUDGET bytes are dropped least recently used first, and
+# so are the images and downsampled copies made from them beyond theirs;
+# those on screen are always kept.
+TILE_BUDGET = 64 << 20
+IMAGE_BUDGET = 16 << 20
+POOLED_BUDGET = 16 << 20
+
+
+def argb_pixels(alpha, color):
+    alpha = alpha.astype(np.uint32)
+    rgb = [
+        (alpha * channel + 127) // 255
+        for channel in (color.red(), color.green(), color.blue())
+    ]
+    pixels = (alpha << 24) | (rgb[0] << 16) | (rgb[1] << 8) | rgb[2]
+    return np.ascontiguousarray(pixels, dtype=np.uint32)
+
+
+def _keys_in(viewport, keys):
+    x_min, y_min, x_max, y_max = viewport
+    tx0, tx1 = x_min // TILE_SIZE, x_max // TILE_SIZE
+    ty0, ty1 = y_min // TILE_SIZE, y_max // TILE_SIZE
+
+    if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) < len(keys):
+        return [
+            (tx, ty)
+            for tx in range(tx0, tx1 + 1)
+            for ty in range(ty0, ty1 + 1)
+            if (tx, ty) in keys
+        ]
+    return [(tx, ty) for tx, ty in keys if tx0 <= tx <= tx1 and ty0 <= ty <= ty1]
+
+
+def tile_bounds(key):
+    x, y = key[0] * TILE_SIZE, key[1] * TILE_SIZE
+    return x, y, x + TILE_SIZE - 1, y + TILE_SIZE - 1
+
+
+class RasterLayer:
+    # Committed cells as alpha tiles. A dropped tile is listed in `evicted`
+    # and is not stamped again until restore() rebuilds it whole from the
+    # spans of every shape on it.
+
+    def __init__(self, color, budget=TILE_BUDGET):
+        self.color = color
+        self.max_tiles = max(1, budget // (TILE_SIZE * TILE_SIZE))
+        self.tiles = OrderedDict()
+        self.evicted = set()
+        self._images = OrderedDict()
+        self._pooled = OrderedDict()
+        self._kept = None
+
+    def clear(self):
+        self.tiles.clear()
+        self.evicted.clear()
+        self._images.clear()
+        self._pooled.clear()
+
+    def _is_kept(self, key):
+        if self._kept is None:
+            return False
+        x_min, y_min, x_max, y_max = self._kept
+        return (
+            x_min // TILE_SIZE <= key[0] <= x_max // TILE_SIZE
+            and y_min // TILE_SIZE <= key[1] <= y_max // TILE_SIZE
+        )
+
+    def _oldest(self, cache, limit):
+        # Keys to drop from `cache` to bring it down to `limit`, oldest first.
+        excess = len(cache) - limit
+        if excess <= 0:
+            return []
+        unkept = (key for key in cache if not self._is_kept(key))
+        return list(islice(unkept, excess))
+
+    def _evict(self):
+        for key in self._oldest(self.tiles, self.max_tiles):
+            del self.tiles[key]
+            self.evicted.add(key)
+            self._images.pop(key, None)
+            self._pooled.pop(key, None)
+
+    def trim(self, viewport):
+        # Drops what is over budget, keeping the tiles that meet `viewport`
+        # (and, until the next call, any stamped there).
+        self._kept = viewport
+        self._evict()
+        images = IMAGE_BUDGET // (TILE_SIZE * TILE_SIZE * 4)
+        for key in self._oldest(self._images, images):
+            del self._images[key]
+        pooled = POOLED_BUDGET // (TILE_SIZE * TILE_SIZE // 4)
+        for key in self._oldest(self._pooled, pooled):
+            del self._pooled[key]
+
+    def evicted_keys(self, viewport):
+        return _keys_in(viewport, self.evicted)
+
+    def restore(self, keys, spans):
+        # Rebuilds evicted tiles `keys`; `spans` must hold every stamped
+        # cell that falls on them.
+        self.evicted.difference_update(keys)
+        for key in keys:
+            x_min, y_min, x_max, y_max = tile_bounds(key)
+            keep = (spans["y"] >= y_min) & (spans["y"] <= y_max)
+            keep &= (spans["x_end"] >= x_min) & (spans["x_start"] <= x_max)
+            part = spans[keep]
+            part["x_start"] = np.maximum(part["x_start"], x_min)
+            part["x_end"] = np.minimum(part["x_end"], x_max)
+            self.stamp_spans(part)
+
+    def stamp_spans(self, spans):
+        if len(spans) == 0:
+            return
+        self.stamp_cells(*span_cells(spans))
+
+    def stamp_cells(self, x, y, alpha):
+        tx, col = np.divmod(x, TILE_SIZE)
+        ty, row = np.divmod(y, TILE_SIZE)
+        # Tile arrays are stored top row first, like the image they become.
+        row = TILE_SIZE - 1 - row
+
+        keys = np.stack([tx, ty], axis=1)
+        order = np.lexsort((ty, tx))
+        keys = keys[order]
+        bounds = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+
+        for group in np.split(order, bounds):
+            key = (int(tx[group[0]]), int(ty[group[0]]))
+            if key in self.evicted:
+                continue
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = self.tiles[key] = np.zeros((TILE_SIZE, TILE_SIZE), np.uint8)
+                self._evict()
+            else:
+                self.tiles.move_to_end(key)
+
+            # Overlapping cells compound like repeated translucent fills.
+            clear = 1.0 - tile / 255.0
+            np.multiply.at(clear, (row[group], col[group]), 1.0 - alpha[group])
+            tile[:] = np.rint((1.0 - clear) * 255.0)
+            self._images.pop(key, None)
+            self._pooled.pop(key, None)
+
+    def _image(self, key):
+        cached = self._images.get(key)
+        if cached is not None:
+            self._images.move_to_end(key)
+            return cached[1]
+
+        pixels = argb_pixels(self.tiles[key], self.color)
+        image = QImage(
+            pixels.data,
+            TILE_SIZE,
+            TILE_SIZE,
+            TILE_SIZE * 4,
+            QImage.Format.Format_ARGB32_Premultiplied,
+        )
+        # The image shares the array's memory, so both are kept together.
+        self._images[key] = (pixels, image)
+        return image
+
+    def _pooled_tile(self, key, factor):
+        if factor == 1:
+            return self.tiles[key]
+        levels = self._pooled.setdefault(key, {})
+        self._pooled.move_to_end(key)
+        tile = levels.get(factor)
+        if tile is None:
+            n = TILE_SIZE // factor
+            tile = self.tiles[key].reshape(n, factor, n, factor).max(axis=(1, 3))
+            levels[factor] = tile
+        return tile
+
+    def _visible_keys(self, viewport):
+        keys = _keys_in(viewport, self.tiles)
+        for key in keys:
+            self.tiles.move_to_end(key)
+        return keys
+
+    def pooled(self, viewport, factor):
+        # Alpha of the viewport downsampled by `factor` (a power of two), top
+        # row first; each entry is the max alpha of the cells it covers.
+        x_min, y_min, x_max, y_max = viewport
+        bx0, by1 = x_min // factor, y_max // factor
+        alpha = np.zeros(
+            (by1 - y_min // factor + 1, x_max // factor - bx0 + 1), np.uint8
+        )
+
+        n = TILE_SIZE // factor
+        for tx, ty in self._visible_keys(viewport):
+            left = tx * n - bx0
+            top = by1 - (ty * n + n - 1)
+            c0, r0 = max(0, -left), max(0, -top)
+            c1 = min(n, alpha.shape[1] - left)
+            r1 = min(n, alpha.shape[0] - top)
+            if c0 >= c1 or r0 >= r1:
+                continue
+
+            region = alpha[top + r0 : top + r1, left + c0 : left + c1]
+            tile = self._pooled_tile((tx, ty), factor)
+            np.maximum(region, tile[r0:r1, c0:c1], out=region)
+
+        return alpha
+
+    def draw(self, painter: QPainter, viewport, offset_x, offset_y, cell_size, h):
+        if not self.tiles:
+            return
+
+        size = TILE_SIZE * cell_size
+        for tx, ty in self._visible_keys(viewport):
+            left = offset_x + tx * size
+            top = h - offset_y - (ty + 1) * size
+            painter.drawImage(QRectF(left, top, size, size), self._image((tx, ty)))
@@ -0,0 +1,43 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from algorithms.spans import packed_chunks
+
+
+class JobSignals(QObject):
+    chunk_ready = pyqtSignal(object)
+    finished = pyqtSignal()
+
+
+class RasterJob(QRunnable):
+    # Drains a pixel or span generator on a pool thread and hands it back in
+    # packed chunks. Signals are queued, so the slots run on the GUI thread.
+
+    CHUNK_SIZE = 1 << 14
+
+    def __init__(self, generator, spans=False):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.generator = generator
+        self.spans = spans
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            for chunk in packed_chunks(self.generator, self.spans, self.CHUNK_SIZE):
+                if self._cancelled.is_set():
+                    return
+                self.signals.chunk_ready.emit(chunk)
+        finally:
+            self.signals.finished.emit()
+
+    def start(self):
+        QThreadPool.globalInstance().start(self)
@@ -0,0 +1,104 @@
+from collections import defaultdict
+
+
+def span_bounds(spans):
+    if len(spans) == 0:
+        return None
+    return (
+        int(spans["x_start"].min()),
+        int(spans["y"].min()),
+        int(spans["x_end"].max()),
+        int(spans["y"].max()),
+    )
+
+
+def union_bounds(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class GridIndex:
+    # Uniform grid of buckets over world cells. Items whose box would cover
+    # more than `max_buckets` buckets go to a separate list that every query
+    # checks directly, so one huge shape cannot flood the grid.
+
+    def __init__(self, bucket_size=256, max_buckets=64):
+        self.bucket_size = bucket_size
+        self.max_buckets = max_buckets
+        self._buckets = defaultdict(set)
+        self._large = set()
+        self._boxes = {}
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _bucket_range(self, box):
+        size = self.bucket_size
+        return (
+            range(box[0] // size, box[2] // size + 1),
+            range(box[1] // size, box[3] // size + 1),
+        )
+
+    def insert(self, item, box):
+        self.remove(item)
+        if box is None:
+            return
+
+        self._boxes[item] = box
+        xs, ys = self._bucket_range(box)
+        if len(xs) * len(ys) > self.max_buckets:
+            self._large.add(item)
+            return
+        for bx in xs:
+            for by in ys:
+                self._buckets[bx, by].add(item)
+
+    def remove(self, item):
+        box = self._boxes.pop(item, None)
+        if box is None:
+            return
+
+        if item in self._large:
+            self._large.discard(item)
+            return
+        xs, ys = self._bucket_range(box)
+        for bx in xs:
+            for by in ys:
+                bucket = self._buckets.get((bx, by))
+                if bucket is not None:
+                    bucket.discard(item)
+                    if not bucket:
+                        del self._buckets[bx, by]
+
+    def bounds(self, item):
+        return self._boxes.get(item)
+
+    def query(self, rect, among=None):
+        # Items whose box meets `rect`, out of `among` if it is given. A few
+        # items among many are tested directly instead of through the grid.
+        xs, ys = self._bucket_range(rect)
+        if among is not None and len(among) * 4 < len(self._boxes):
+            candidates = among & self._boxes.keys()
+        elif len(xs) * len(ys) > len(self._buckets):
+            candidates = set(self._boxes)
+        else:
+            candidates = set(self._large)
+            for bx in xs:
+                for by in ys:
+                    candidates.update(self._buckets.get((bx, by), ()))
+        if among is not None:
+            candidates &= among
+
+        return {item for item in candidates if intersects(self._boxes[item], rect)}
+
+    def clear(self):
+        self._buckets.clear()
+        self._large.clear()
+        self._boxes.clear()
@@ -1,19 +1,124 @@
 from abc import ABC, abstractmethod
 
-from PyQt6.QtWidgets import QWidget
+from PyQt6.QtCore import QElapsedTimer, Qt, QTimer
+from PyQt6.QtWidgets import QHBoxLayout, QPushButton, QSpinBox, QWidget
+
+PREVIEW_INTERVAL = 30
+PLAYBACK_INTERVAL = 16
 
 
 class BaseTool(ABC):
     def __init__(self, canvas):
         self.canvas = canvas
         self._settings_widget = None
+        self.preview_checkbox = None
+
+        # Point edits can arrive far faster than shapes rasterize, so they
+        # are coalesced into at most one preview per interval.
+        self._preview_timer = QTimer()
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(PREVIEW_INTERVAL)
+        self._preview_timer.timeout.connect(self._refresh_preview)
+
+        self.play_btn = None
+        self._play_timer = QTimer()
+        self._play_timer.setInterval(PLAYBACK_INTERVAL)
+        self._play_timer.timeout.connect(self._advance_playback)
+        self._play_clock = QElapsedTimer()
+        self._play_carry = 0.0
 
     @abstractmethod
     def get_settings_widget(self) -> QWidget:
         pass
 
     def activate(self):
-        pass
+        self.canvas.shape_changed.connect(self.on_shape_changed)
+        self.canvas.points_changed.connect(self.schedule_preview)
+        self.canvas.viewport_changed.connect(self.schedule_preview)
+        self.schedule_preview()
 
     def deactivate(self):
-        pass
+        self.canvas.shape_changed.disconnect(self.on_shape_changed)
+        self.canvas.points_changed.disconnect(self.schedule_preview)
+        self.canvas.viewport_changed.disconnect(self.schedule_preview)
+        self._preview_timer.stop()
+        self.canvas.clear_preview()
+        if self.play_btn is not None:
+            self.play_btn.setChecked(False)
+
+    def on_shape_changed(self):
+        max_steps = self.canvas.get_max_steps()
+        self.step_slider.setMaximum(max_steps)
+        if not self.debug_checkbox.isChecked():
+            self.step_slider.setValue(max_steps)
+        self.step_label.setText(f"Step: {self.step_slider.value()} / {max_steps}")
+        self._update_step_buttons()
+
+    def preview_generator(self):
+        # (generator, spans) for the shape the current points would draw,
+        # clipped to the viewport where the algorithm allows, or None.
+        return None
+
+    def schedule_preview(self):
+        if not self._preview_timer.isActive():
+            self._preview_timer.start()
+
+    def _refresh_preview(self):
+        preview = None
+        if self.preview_checkbox is not None and self.preview_checkbox.isChecked():
+            preview = self.preview_generator()
+
+        if preview is None:
+            self.canvas.clear_preview()
+        else:
+            self.canvas.run_preview(*preview)
+
+    def _create_playback_controls(self):
+        # Auto-play for the debug slider; needs debug_checkbox and
+        # step_slider to exist already.
+        layout = QHBoxLayout()
+
+        self.play_btn = QPushButton("▶ Play")
+        self.play_btn.setCheckable(True)
+        self.play_btn.setEnabled(False)
+        self.play_btn.toggled.connect(self.on_play_toggled)
+        layout.addWidget(self.play_btn)
+
+        self.speed_spin = QSpinBox()
+        self.speed_spin.setRange(1, 10000)
+        self.speed_spin.setValue(20)
+        self.speed_spin.setSuffix(" steps/s")
+        layout.addWidget(self.speed_spin)
+
+        self.debug_checkbox.stateChanged.connect(self._on_playback_available)
+        return layout
+
+    def _on_playback_available(self, state):
+        enabled = state == Qt.CheckState.Checked.value
+        self.play_btn.setEnabled(enabled)
+        if not enabled:
+            self.play_btn.setChecked(False)
+
+    def on_play_toggled(self, playing):
+        self.play_btn.setText("❚❚ Pause" if playing else "▶ Play")
+        if not playing:
+            self._play_timer.stop()
+            return
+
+        if self.step_slider.value() >= self.step_slider.maximum():
+            self.step_slider.setValue(0)
+        self._play_carry = 0.0
+        self._play_clock.start()
+        self._play_timer.start()
+
+    def _advance_playback(self):
+        # Steps follow elapsed time, so fast speeds move several per tick.
+        self._play_carry += self._play_clock.restart() * self.speed_spin.value() / 1000
+        steps = int(self._play_carry)
+        self._play_carry -= steps
+        if steps:
+            self.step_slider.setValue(self.step_slider.value() + steps)
+
+        at_end = self.step_slider.value() >= self.step_slider.maximum()
+        if at_end and self.canvas.job is None:
+            self.play_btn.setChecked(False)
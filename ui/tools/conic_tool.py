@@ -1,5 +1,3 @@
-import math
-
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (
     QCheckBox,
@@ -14,12 +12,7 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from algorithms.conics import (
-    bresenham_circle,
-    midpoint_ellipse,
-    midpoint_hyperbola,
-    midpoint_parabola,
-)
+from scene.shapes import ConicShape
 from ui.tools.base_tool import BaseTool
 
 
@@ -56,6 +49,17 @@ class ConicsToolWidget(BaseTool):
         self.curve_combo.currentIndexChanged.connect(self.on_curve_changed)
 
         curve_layout.addWidget(self.curve_combo)
+
+        self.grow_checkbox = QCheckBox("Extend branches to viewport")
+        self.grow_checkbox.setChecked(True)
+        self.grow_checkbox.setEnabled(False)
+        self.grow_checkbox.stateChanged.connect(self.schedule_preview)
+        curve_layout.addWidget(self.grow_checkbox)
+
+        self.preview_checkbox = QCheckBox("Live preview")
+        self.preview_checkbox.setChecked(True)
+        self.preview_checkbox.stateChanged.connect(self.schedule_preview)
+        curve_layout.addWidget(self.preview_checkbox)
         curve_group.setLayout(curve_layout)
         layout.addWidget(curve_group)
 
@@ -126,6 +130,7 @@ class ConicsToolWidget(BaseTool):
         step_buttons_layout.addWidget(self.prev_btn)
         step_buttons_layout.addWidget(self.next_btn)
         debug_layout.addLayout(step_buttons_layout)
+        debug_layout.addLayout(self._create_playback_controls())
 
         debug_group.setLayout(debug_layout)
         layout.addWidget(debug_group)
@@ -198,7 +203,11 @@ class ConicsToolWidget(BaseTool):
         self.hint_label.setText(hints.get(curve_type, ""))
 
     def on_curve_changed(self):
+        self.schedule_preview()
         self.update_hint_label()
+        self.grow_checkbox.setEnabled(
+            self.curve_combo.currentData() in ("hyperbola", "parabola")
+        )
 
     def on_zoom_in(self):
         self.canvas.zoom_in()
@@ -246,45 +255,32 @@ class ConicsToolWidget(BaseTool):
                 self.step_slider.value() < self.step_slider.maximum()
             )
 
+    def _shape(self, points):
+        params = {"grow": True} if self.grow_checkbox.isChecked() else {}
+        return ConicShape(self.curve_combo.currentData(), points[:2], **params)
+
+    def preview_generator(self):
+        points = self.canvas.get_clicked_points()
+        if len(points) < 2:
+            return None
+
+        # Circles and ellipses are cut down to the viewport, and growing
+        # branches would reach its edge, so the preview walks exactly that
+        # far.
+        generator, spans = self._shape(points).generator(
+            viewport=self.canvas.get_viewport()
+        )
+        return (generator, spans) if generator else None
+
     def on_draw(self):
         points = self.canvas.get_clicked_points()
         if len(points) < 2:
             return
 
-        x1, y1 = points[0]
-        x2, y2 = points[1]
+        shape = self._shape(points)
+        if not self.canvas.add_shape(shape, stepping=self.debug_checkbox.isChecked()):
+            return
 
-        curve_type = self.curve_combo.currentData()
-        generator = None
-
-        if curve_type == "circle":
-            r = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-            generator = bresenham_circle(x1, y1, r)
-        elif curve_type == "ellipse":
-            a = abs(x2 - x1)
-            b = abs(y2 - y1)
-            if a > 0 and b > 0:
-                generator = midpoint_ellipse(x1, y1, a, b)
-        elif curve_type == "hyperbola":
-            a = abs(x2 - x1)
-            b = abs(y2 - y1)
-            if a > 0 and b > 0:
-                generator = midpoint_hyperbola(x1, y1, a, b)
-        elif curve_type == "parabola":
-            dx = x2 - x1
-            direction = 1 if dx > 0 else -1
-            p = max(1, abs(dx))
-            generator = midpoint_parabola(x1, y1, p, direction)
-
-        if generator:
-            self.canvas.run_algorithm(generator)
-            self.canvas.clear_clicked_points()
-
-            max_steps = self.canvas.get_max_steps()
-            self.step_slider.setMaximum(max_steps)
-            if self.debug_checkbox.isChecked():
-                self.step_slider.setValue(0)
-            else:
-                self.step_slider.setValue(max_steps)
-            self.step_label.setText(f"Step: {self.step_slider.value()} / {max_steps}")
-            self._update_step_buttons()
+        self.canvas.clear_clicked_points()
+
+        self.on_shape_changed()
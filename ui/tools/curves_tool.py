@@ -1,11 +1,14 @@
+import numpy as np
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (
     QCheckBox,
     QComboBox,
+    QDoubleSpinBox,
     QFrame,
     QGroupBox,
     QHBoxLayout,
     QLabel,
+    QLineEdit,
     QPushButton,
     QSlider,
     QSpinBox,
@@ -13,18 +16,33 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from algorithms.parametric_curves import (
-    bezier_curve,
-    bspline_curve,
-    hermite_curve,
-)
+from algorithms.parametric_curves import BSplineRaster, IncrementalBSpline
+from scene.shapes import CurveShape
 from ui.tools.base_tool import BaseTool
 
 
+def _live_spans(points, steps, connected, built):
+    # Builds the live B-spline's raster on the RasterJob's thread and hands
+    # it over through `built` once nothing else will touch it there.
+    raster = BSplineRaster(IncrementalBSpline(points, steps=steps), connected)
+    spans = raster.spans()
+    built.append(raster)
+    yield spans
+
+
 class CurvesTool(BaseTool):
     def __init__(self, canvas):
         super().__init__(canvas)
+        # The live B-spline's handles are the first _live_handles clicked
+        # points. Its segment-wise raster is built by the job that draws the
+        # shape and taken over once that job is done.
+        self._live_shape_index = None
+        self._live_handles = 0
+        self._live_job = None
+        self._live_built = []
+        self._live_raster = None
         self._create_settings_widget()
+        self.canvas.point_moved.connect(self._on_point_moved)
 
     def _create_settings_widget(self):
         widget = QFrame()
@@ -49,6 +67,8 @@ class CurvesTool(BaseTool):
         self.curve_combo.addItem("Hermite", "hermite")
         self.curve_combo.addItem("Bezier", "bezier")
         self.curve_combo.addItem("B-spline", "bspline")
+        self.curve_combo.addItem("Bezier (degree n)", "bezier_n")
+        self.curve_combo.addItem("NURBS", "nurbs")
         self.curve_combo.setCurrentIndex(0)
         self.curve_combo.currentIndexChanged.connect(self._on_curve_changed)
 
@@ -74,7 +94,57 @@ class CurvesTool(BaseTool):
         self.segments_spin.setValue(20)
         params_layout.addWidget(self.segments_spin)
 
+        self.adaptive_checkbox = QCheckBox("Adaptive sampling")
+        self.adaptive_checkbox.setChecked(False)
+        self.adaptive_checkbox.stateChanged.connect(self._on_sampling_changed)
+        params_layout.addWidget(self.adaptive_checkbox)
+
+        params_layout.addWidget(QLabel("Flatness tolerance (cells):"))
+        self.tolerance_spin = QDoubleSpinBox()
+        self.tolerance_spin.setRange(0.05, 10.0)
+        self.tolerance_spin.setSingleStep(0.05)
+        self.tolerance_spin.setValue(0.5)
+        self.tolerance_spin.setEnabled(False)
+        params_layout.addWidget(self.tolerance_spin)
+
+        self.connected_checkbox = QCheckBox("Connect samples")
+        self.connected_checkbox.setChecked(False)
+        params_layout.addWidget(self.connected_checkbox)
+
+        self.live_edit_checkbox = QCheckBox("Live edit B-spline points")
+        self.live_edit_checkbox.setChecked(True)
+        params_layout.addWidget(self.live_edit_checkbox)
+
+        self.preview_checkbox = QCheckBox("Live preview")
+        self.preview_checkbox.setChecked(True)
+        params_layout.addWidget(self.preview_checkbox)
+
+        params_layout.addWidget(QLabel("NURBS degree:"))
+        self.degree_spin = QSpinBox()
+        self.degree_spin.setMinimum(1)
+        self.degree_spin.setMaximum(9)
+        self.degree_spin.setValue(3)
+        self.degree_spin.setEnabled(False)
+        params_layout.addWidget(self.degree_spin)
+
+        params_layout.addWidget(QLabel("NURBS weights:"))
+        self.weights_edit = QLineEdit()
+        self.weights_edit.setPlaceholderText("1, 1, 1, ... (default all 1)")
+        self.weights_edit.setEnabled(False)
+        params_layout.addWidget(self.weights_edit)
+
         params_group.setLayout(params_layout)
+
+        for signal in (
+            self.segments_spin.valueChanged,
+            self.adaptive_checkbox.stateChanged,
+            self.tolerance_spin.valueChanged,
+            self.connected_checkbox.stateChanged,
+            self.preview_checkbox.stateChanged,
+            self.degree_spin.valueChanged,
+            self.weights_edit.textChanged,
+        ):
+            signal.connect(self.schedule_preview)
         layout.addWidget(params_group)
 
         self.draw_btn = QPushButton("▶ Draw Curve")
@@ -138,6 +208,7 @@ class CurvesTool(BaseTool):
         step_buttons_layout.addWidget(self.prev_btn)
         step_buttons_layout.addWidget(self.next_btn)
         debug_layout.addLayout(step_buttons_layout)
+        debug_layout.addLayout(self._create_playback_controls())
 
         debug_group.setLayout(debug_layout)
         layout.addWidget(debug_group)
@@ -199,18 +270,114 @@ class CurvesTool(BaseTool):
             "hermite": "Click 4 points: P0, P1 (endpoints) + M0, M1 (tangent vectors)",
             "bezier": "Click 4 points: P0, P1, P2, P3 (control points)",
             "bspline": "Click 4+ points: control polygon vertices",
+            "bezier_n": "Click 2+ points: control polygon (degree = points - 1)",
+            "nurbs": "Click degree + 1 or more points: control polygon vertices",
         }
         self.hint_label.setText(hints.get(curve_type, ""))
 
     def _on_curve_changed(self):
+        self._end_live_edit()
+        self.schedule_preview()
         self._update_hint()
+        nurbs = self.curve_combo.currentData() == "nurbs"
+        self.degree_spin.setEnabled(nurbs)
+        self.weights_edit.setEnabled(nurbs)
+
+    def _nurbs_weights(self, count):
+        text = self.weights_edit.text().strip()
+        if not text:
+            return None
+        try:
+            weights = [float(w) for w in text.replace(",", " ").split()]
+        except ValueError:
+            return None
+        weights = (weights + [1.0] * count)[:count]
+        return weights if all(w > 0 for w in weights) else None
+
+    def _on_sampling_changed(self):
+        adaptive = self.adaptive_checkbox.isChecked()
+        self.segments_spin.setEnabled(not adaptive)
+        self.tolerance_spin.setEnabled(adaptive)
 
     def get_settings_widget(self) -> QWidget:
         return self._settings_widget
 
     def activate(self):
+        super().activate()
+        self.canvas.points_changed.connect(self._on_points_changed)
         self.update_scale_label()
 
+    def deactivate(self):
+        super().deactivate()
+        self.canvas.points_changed.disconnect(self._on_points_changed)
+        self._end_live_edit()
+
+    def on_shape_changed(self):
+        super().on_shape_changed()
+        if self._live_shape_index is not None and self._live_raster is None:
+            self._take_live_raster()
+
+    def _reset_live(self):
+        self._live_shape_index = None
+        self._live_handles = 0
+        self._live_job = None
+        self._live_built = []
+        self._live_raster = None
+
+    def _end_live_edit(self):
+        # The handles go with the curve they shaped, so that the next curve
+        # is drawn from the points clicked after them.
+        if self._live_shape_index is None:
+            return
+        del self.canvas.clicked_points[: self._live_handles]
+        self.canvas.edited_point_idx = None
+        self._reset_live()
+        self.canvas.update()
+
+    def _on_points_changed(self):
+        # A point clicked after the handles starts the next curve.
+        if self._live_shape_index is None:
+            return
+        if len(self.canvas.clicked_points) != self._live_handles:
+            self._end_live_edit()
+
+    def _take_live_raster(self):
+        # Waits for the job drawing the live shape, then catches the raster
+        # up with the handles moved in the meantime.
+        if self.canvas.job is self._live_job:
+            return
+        shape = self.canvas.scene.shapes[self._live_shape_index]
+        if self._live_built:
+            raster = self._live_built[0]
+        else:
+            # Cancelled before it got that far, e.g. by a save.
+            spline = IncrementalBSpline(shape.points, steps=shape.params["steps"])
+            raster = BSplineRaster(spline, shape.params["connected"])
+
+        moved = np.any(raster.spline.control != shape.points, axis=1)
+        for index in np.flatnonzero(moved).tolist():
+            raster.move_point(index, shape.points[index])
+        self._live_raster = raster
+        if moved.any() or not self._live_built:
+            self.canvas.replace_shape(self._live_shape_index, shape, raster.spans())
+
+    def _on_point_moved(self, x, y):
+        index = self.canvas.edited_point_idx
+        if index is None or index >= self._live_handles:
+            return
+
+        point = self.canvas.clicked_points[index]
+        shape = self.canvas.scene.shapes[self._live_shape_index]
+        shape.points[index] = tuple(point)
+
+        # Only the segments the move touched are rasterized again and
+        # spliced into the stored raster.
+        if self._live_raster is None:
+            self._take_live_raster()
+        else:
+            start, stop, spans = self._live_raster.move_point(index, point)
+            self.canvas.splice_shape(self._live_shape_index, shape, start, stop, spans)
+
     def update_scale_label(self):
         self.scale_label.setText(f"{self.canvas.cell_size} px")
 
@@ -227,6 +394,7 @@ class CurvesTool(BaseTool):
         self.update_scale_label()
 
     def on_clear(self):
+        self._reset_live()
         self.canvas.clear_all()
         self.step_slider.setMaximum(0)
         self.step_slider.setValue(0)
@@ -260,44 +428,66 @@ class CurvesTool(BaseTool):
                 self.step_slider.value() < self.step_slider.maximum()
             )
 
+    def _sampling(self):
+        connected = self.connected_checkbox.isChecked()
+        sampling = {"connected": connected}
+        if self.adaptive_checkbox.isChecked():
+            sampling["tolerance"] = self.tolerance_spin.value()
+            if not connected:
+                # Chords of at most one cell keep consecutive samples touching.
+                sampling["max_chord"] = 1.0
+        return sampling
+
+    def _shape(self, points):
+        curve_type = self.curve_combo.currentData()
+        params = {"steps": self.segments_spin.value()}
+
+        if curve_type == "nurbs":
+            params["degree"] = self.degree_spin.value()
+            params["weights"] = self._nurbs_weights(len(points))
+        if curve_type in ("bezier_n", "nurbs"):
+            params["connected"] = self.connected_checkbox.isChecked()
+        else:
+            params.update(self._sampling())
+        return CurveShape(curve_type, points, **params)
+
+    def preview_generator(self):
+        # A live B-spline already redraws itself as its handles move.
+        if self._live_shape_index is not None:
+            return None
+        generator, spans = self._shape(self.canvas.get_clicked_points()).generator(
+            viewport=self.canvas.get_viewport()
+        )
+        return (generator, spans) if generator else None
+
     def on_draw(self):
         points = self.canvas.get_clicked_points()
-        curve_type = self.curve_combo.currentData()
-        segments = self.segments_spin.value()
+        shape = self._shape(points)
+        built = []
         generator = None
 
-        if curve_type == "hermite":
-            if len(points) < 4:
-                return
-            p0 = points[0]
-            p1 = points[1]
-            m0 = points[2]
-            m1 = points[3]
-            generator = hermite_curve(p0, p1, m0, m1, steps=segments)
-
-        elif curve_type == "bezier":
-            if len(points) < 4:
-                return
-            p0 = points[0]
-            p1 = points[1]
-            p2 = points[2]
-            p3 = points[3]
-            generator = bezier_curve(p0, p1, p2, p3, steps=segments)
-
-        elif curve_type == "bspline":
-            if len(points) < 4:
-                return
-            generator = bspline_curve(points, steps=segments)
-
-        if generator:
-            self.canvas.run_algorithm(generator)
-            self.canvas.clear_clicked_points()
-
-            max_steps = self.canvas.get_max_steps()
-            self.step_slider.setMaximum(max_steps)
-            if self.debug_checkbox.isChecked():
-                self.step_slider.setValue(0)
+        live = (
+            self.curve_combo.currentData() == "bspline"
+            and len(points) >= 4
+            and self.live_edit_checkbox.isChecked()
+            and not self.adaptive_checkbox.isChecked()
+        )
+        if live:
+            # Points stay on the canvas as handles; dragging one with the
+            # middle button re-evaluates only the segments it touches.
+            generator = _live_spans(
+                points, self.segments_spin.value(), shape.params["connected"], built
+            )
+
+        stepping = self.debug_checkbox.isChecked()
+        if self.canvas.add_shape(shape, stepping=stepping, generator=generator):
+            self._reset_live()
+            if live:
+                self._live_shape_index = len(self.canvas.scene) - 1
+                self._live_handles = len(points)
+                self._live_job = self.canvas.job
+                self._live_built = built
             else:
-                self.step_slider.setValue(max_steps)
-            self.step_label.setText(f"Step: {self.step_slider.value()} / {max_steps}")
-            self._update_step_buttons()
+                self.canvas.clear_clicked_points()
+
+            self.on_shape_changed()
@@ -12,7 +12,7 @@ from PyQt6.QtWidgets import (
     QWidget,
 )
 
-from algorithms.straight_lines import bresenham_int_line, dda_line, wu_line
+from scene.shapes import LineShape
 from ui.tools.base_tool import BaseTool
 
 
@@ -45,8 +45,18 @@ class LineTool(BaseTool):
         self.algo_combo.addItem("Bresenham", "bresenham")
         self.algo_combo.addItem("Wu (antialiasing)", "wu")
         self.algo_combo.setCurrentIndex(0)
+        self.algo_combo.currentIndexChanged.connect(self.schedule_preview)
 
         algo_layout.addWidget(self.algo_combo)
+
+        self.clip_checkbox = QCheckBox("Clip to viewport")
+        self.clip_checkbox.setChecked(False)
+        algo_layout.addWidget(self.clip_checkbox)
+
+        self.preview_checkbox = QCheckBox("Live preview")
+        self.preview_checkbox.setChecked(True)
+        self.preview_checkbox.stateChanged.connect(self.schedule_preview)
+        algo_layout.addWidget(self.preview_checkbox)
         algo_group.setLayout(algo_layout)
         layout.addWidget(algo_group)
 
@@ -111,6 +121,7 @@ class LineTool(BaseTool):
         step_buttons_layout.addWidget(self.prev_btn)
         step_buttons_layout.addWidget(self.next_btn)
         debug_layout.addLayout(step_buttons_layout)
+        debug_layout.addLayout(self._create_playback_controls())
 
         debug_group.setLayout(debug_layout)
         layout.addWidget(debug_group)
@@ -218,33 +229,28 @@ class LineTool(BaseTool):
                 self.step_slider.value() < self.step_slider.maximum()
             )
 
+    def _shape(self, points, clip=None):
+        params = {} if clip is None else {"clip": clip}
+        return LineShape(self.algo_combo.currentData(), points[:2], **params)
+
+    def preview_generator(self):
+        points = self.canvas.get_clicked_points()
+        if len(points) < 2:
+            return None
+        generator, spans = self._shape(points).generator(
+            viewport=self.canvas.get_viewport()
+        )
+        return (generator, spans) if generator else None
+
     def on_draw(self):
         points = self.canvas.get_clicked_points()
         if len(points) < 2:
             return
 
-        x1, y1 = points[0]
-        x2, y2 = points[1]
-
-        algo_data = self.algo_combo.currentData()
-
-        generator = None
-        if algo_data == "dda":
-            generator = dda_line(x1, y1, x2, y2)
-        elif algo_data == "bresenham":
-            generator = bresenham_int_line(x1, y1, x2, y2)
-        elif algo_data == "wu":
-            generator = wu_line(x1, y1, x2, y2)
+        clip = self.canvas.get_viewport() if self.clip_checkbox.isChecked() else None
+        shape = self._shape(points, clip)
 
-        if generator:
-            self.canvas.run_algorithm(generator)
+        if self.canvas.add_shape(shape, stepping=self.debug_checkbox.isChecked()):
             self.canvas.clear_clicked_points()
 
-            max_steps = self.canvas.get_max_steps()
-            self.step_slider.setMaximum(max_steps)
-            if self.debug_checkbox.isChecked():
-                self.step_slider.setValue(0)
-            else:
-                self.step_slider.setValue(max_steps)
-            self.step_label.setText(f"Step: {self.step_slider.value()} / {max_steps}")
-            self._update_step_buttons()
+            self.on_shape_changed()